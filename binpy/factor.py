@@ -7,43 +7,675 @@
 """
 
 import sys
+import json
 import math
+import bisect
+import collections
+import time
+import random
 import subprocess
-from functools import reduce
+import numpy as np
+import multiprocessing as mp
+import primes
 
 
 # The problem with relying on any floating point computation (math.sqrt(x), or x**0.5)
 # is that you can't really be sure it's exact (for sufficiently large integers x, it
-# won't be, and might even overflow).
-# This is based on the "Babylonian algorithm" for square root, see wikipedia. It does
-# work for any positive number for which you have enough memory as is reasonably fast
+# won't be, and might even overflow), so math.isqrt is used for exact integer roots.
+# Most non-squares are rejected before any root is taken: a square must also be a
+# quadratic residue mod 64, 63, 65 and 11, which lets through only ~1 in 119 numbers.
+def QuadraticResidues(m):
+    residues = [False] * m
+    for i in range(m):
+        residues[i*i % m] = True
+    return residues
+
+SQUARES_MOD64 = QuadraticResidues(64)
+SQUARES_MOD63 = QuadraticResidues(63)
+SQUARES_MOD65 = QuadraticResidues(65)
+SQUARES_MOD11 = QuadraticResidues(11)
+
 def HasSquare(apositiveint):
-    x = apositiveint // 2
-    seen = set([x])
-    while x * x != apositiveint:
-        x = (x + (apositiveint // x)) // 2
-        if x in seen: return False
-        seen.add(x)
-    return True
+    if not SQUARES_MOD64[apositiveint & 63]:
+        return False
+    r = apositiveint % 45045     # 63 * 65 * 11, one big-int mod for the three tables
+    if not (SQUARES_MOD63[r % 63] and SQUARES_MOD65[r % 65] and SQUARES_MOD11[r % 11]):
+        return False
+    x = math.isqrt(apositiveint)
+    return x * x == apositiveint
 
 
 # Fermat's factorisation which works with semi-primes that are close together.
 # A semi-prime (N) is a number with only two prime factors, and for large numbers
 # it's always odd.
-def FermatFactor(N):
-    a = math.ceil(math.sqrt(N))
+# b2 = a*a - N is updated incrementally: (a+1)^2 - N = b2 + 2a + 1
+# If steps is given then None is returned when no square is found within that many steps.
+def FermatFactor(N, steps=None):
+    if N % 2 == 0:
+        return 2
+    a = math.isqrt(N)
+    if a * a < N:
+        a += 1
     b2 = a*a - N
+    step = 0
     while not HasSquare(b2):
-        a += 1       # equivalently: b2 = b2 + 2*a + 1
-        b2 = a*a - N
-    return int(a - math.sqrt(b2)) # or a + sqrt(b2)
+        b2 += 2*a + 1
+        a += 1
+        step += 1
+        if steps is not None and step >= steps:
+            return None
+    return a - math.isqrt(b2) # or a + isqrt(b2)
+
+
+# Miller-Rabin: the first 12 prime bases are deterministic below 3.3e24,
+# above that extra random bases make a false positive vanishingly unlikely.
+MR_BASES = [2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37]
+
+def IsProbablePrime(n, rounds=8):
+    if n < 2:
+        return False
+    for p in MR_BASES:
+        if n % p == 0:
+            return n == p
+    d = n - 1
+    s = 0
+    while d % 2 == 0:
+        d //= 2
+        s += 1
+    bases = MR_BASES
+    if n >= 3317044064679887385961981:
+        bases = MR_BASES + [random.randrange(2, n - 1) for i in range(rounds)]
+    for a in bases:
+        x = pow(a, d, n)
+        if x == 1 or x == n - 1:
+            continue
+        for r in range(s - 1):
+            x = x * x % n
+            if x == n - 1:
+                break
+        else:
+            return False
+    return True
+
+
+# Residues N % p for a numpy array of primes without N ever being a numpy type:
+# N is fed in k-bit limbs (Horner's rule) with k chosen so r << k fits in a uint64.
+def ResiduesModPrimes(N, ps):
+    ps = ps.astype(np.uint64)
+    if N < 2**63:
+        return np.uint64(N) % ps
+    k = 63 - int(ps.max()).bit_length()
+    mask = (1 << k) - 1
+    r = np.zeros(ps.shape[0], dtype=np.uint64)
+    for shift in range(((N.bit_length() - 1) // k) * k, -1, -k):
+        r = ((r << np.uint64(k)) | np.uint64((N >> shift) & mask)) % ps
+    return r
+
+# One chunk of trial division: the primes in [low, high) which divide N
+def TrialDivisionChunk(args):
+    N, low, high = args
+    ps = primes.sieve_range(low, high)
+    if ps.shape[0] == 0:
+        return []
+    return [int(p) for p in ps[ResiduesModPrimes(N, ps) == 0]]
+
+# Trial division by the primes up to limit (default isqrt(N)). The range is cut into
+# chunks which are sieved and tested in numpy; unless processes=1 the chunks are shared
+# out over a process pool (processes=None uses every cpu), at most 2*processes at a time.
+# Chunks are made as they are needed and only up to the root of what is left of N,
+# so it stops early once the cofactor can have no factor at or above the next chunk.
+# progress(done, limit) is called after each chunk.
+# Returns the prime factors found (with repeats) and the cofactor, which is 1 unless
+# limit was too small to tell.
+def TrialDivision(N, limit=10000, chunk=2**22, processes=1, progress=None):
+    factors = []
+    if limit is None:
+        limit = math.isqrt(N)
+    pool = None
+    if processes != 1 and limit - 1 > chunk:
+        processes = processes or mp.cpu_count()
+        pool = mp.Pool(processes)
+    window = collections.deque()
+    low = high = 2
+    try:
+        while True:
+            stop = min(limit, math.isqrt(N)) + 1
+            while low < stop and (not window or pool is not None and len(window) < 2*processes):
+                args = (N, low, min(low + chunk, stop))
+                window.append((args[2], args if pool is None else pool.apply_async(TrialDivisionChunk, (args,))))
+                low = args[2]
+            if not window:
+                break
+            high, task = window.popleft()
+            found = TrialDivisionChunk(task) if pool is None else task.get()
+            for p in found:
+                while N % p == 0:
+                    factors.append(p)
+                    N //= p
+            if progress is not None:
+                progress(high - 1, limit)
+            if high * high > N:
+                break
+    finally:
+        if pool is not None:
+            pool.terminate()
+    if 1 < N < high * high:          # no factor below high so the cofactor must be prime
+        factors.append(N)
+        N = 1
+    return factors, N
+
+# Every divisor of the product of factors (a list of primes with repeats), sorted
+def AllDivisors(factors):
+    divisors = set([1])
+    for p in factors:
+        divisors |= set(d * p for d in divisors)
+    return sorted(divisors)
+
+# progress function for TrialDivision which prints about steps lines in all
+def ProgressPrinter(steps):
+    last = 0
+    def progress(done, total):
+        nonlocal last
+        mark = done * steps // total
+        if mark > last:
+            last = mark
+            print ("fraction done: %d of %d" % (done, total))
+            sys.stdout.flush()
+    return progress
+
+
+# Pollard's rho, Brent's variant: Floyd's cycle detection is replaced with
+# powers of two and the gcd is taken once every m steps on the product of |x-y|.
+# Returns a non-trivial factor or None if it gives up (after timeout seconds).
+def PollardRhoBrent(N, c=1, m=128, timeout=10.0):
+    if N % 2 == 0:
+        return 2
+    deadline = time.time() + timeout
+    y = random.randrange(1, N)
+    g = r = q = 1
+    while g == 1:
+        x = y
+        for i in range(r):
+            y = (y * y + c) % N
+        k = 0
+        while k < r and g == 1:
+            ys = y
+            for i in range(min(m, r - k)):
+                y = (y * y + c) % N
+                q = q * abs(x - y) % N
+            g = math.gcd(q, N)
+            k += m
+            if g == 1 and time.time() > deadline:
+                return None
+        r *= 2
+    if g == N:                       # overshot: step back through the last block one at a time
+        while True:
+            ys = (ys * ys + c) % N
+            g = math.gcd(abs(x - ys), N)
+            if g > 1:
+                break
+    return g if g != N else None
+
+
+# Pollard's p-1: finds p when p-1 is B1-smooth.
+# Returns a non-trivial factor or None.
+def PollardPm1(N, B1=100000, timeout=10.0):
+    deadline = time.time() + timeout
+    a = 2
+    for i,p in enumerate(primes.sieve_primes(B1 + 1).tolist()):
+        pe = p
+        while pe * p <= B1:
+            pe *= p
+        a = pow(a, pe, N)
+        if i % 1000 == 999:
+            g = math.gcd(a - 1, N)
+            if 1 < g < N:
+                return g
+            if g == N or time.time() > deadline:
+                return None
+    g = math.gcd(a - 1, N)
+    return g if 1 < g < N else None
+
+
+# ECM stage 1 on Montgomery curves By^2 = x^3 + Ax^2 + x using only X:Z coordinates.
+# Suyama's parametrisation (sigma) gives curves with a group order divisible by 12.
+def _xDBL(x, z, a24, N):
+    s = (x + z) * (x + z) % N
+    d = (x - z) * (x - z) % N
+    t = s - d                        # 4xz
+    return s * d % N, t * (d + a24 * t) % N
+
+def _xADD(xp, zp, xq, zq, xd, zd, N):
+    u = (xp - zp) * (xq + zq)
+    v = (xp + zp) * (xq - zq)
+    return zd * (u + v) * (u + v) % N, xd * (u - v) * (u - v) % N
+
+def _ladder(x, z, k, a24, N):
+    x0, z0 = x, z
+    x1, z1 = _xDBL(x, z, a24, N)
+    for bit in bin(k)[3:]:
+        if bit == '1':
+            x0, z0 = _xADD(x1, z1, x0, z0, x, z, N)
+            x1, z1 = _xDBL(x1, z1, a24, N)
+        else:
+            x1, z1 = _xADD(x1, z1, x0, z0, x, z, N)
+            x0, z0 = _xDBL(x0, z0, a24, N)
+    return x0, z0
+
+def ECMCurve(N, B1, sigma, plist):
+    u = (sigma * sigma - 5) % N
+    v = 4 * sigma % N
+    x = pow(u, 3, N)
+    z = pow(v, 3, N)
+    num = pow(v - u, 3, N) * (3 * u + v) % N
+    den = 16 * x * v % N
+    g = math.gcd(den, N)
+    if g != 1:
+        return g
+    a24 = num * pow(den, -1, N) % N
+    for p in plist:
+        pe = p
+        while pe * p <= B1:
+            pe *= p
+        x, z = _ladder(x, z, pe, a24, N)
+    return math.gcd(z, N)
+
+# Returns a non-trivial factor or None after curves curves (or timeout seconds)
+def ECMFactor(N, B1=2000, curves=100, timeout=30.0):
+    deadline = time.time() + timeout
+    plist = primes.sieve_primes(B1 + 1).tolist()
+    for i in range(curves):
+        g = ECMCurve(N, B1, random.randrange(6, N - 1), plist)
+        if 1 < g < N:
+            return g
+        if time.time() > deadline:
+            break
+    return None
+
+
+# Escalating ECM: B1 grows with each round as in the usual tables for factor sizes
+ECM_ROUNDS = [(2000, 25), (11000, 90), (50000, 300), (250000, 700)]
+
+def ECMEscalate(N, timeout=60.0):
+    deadline = time.time() + timeout
+    for B1,curves in ECM_ROUNDS:
+        g = ECMFactor(N, B1=B1, curves=curves, timeout=deadline - time.time())
+        if g is not None or time.time() > deadline:
+            return g
+    return None
+
+
+#############################
+# Self-initialising quadratic sieve (SIQS), after Contini's thesis.
+# Q(x) = (a*x + b)^2 - N = a * g(x) where a = q_1 * ... * q_s is made of factor base
+# primes, so each a gives 2^(s-1) values of b and moving to the next polynomial is one
+# add per prime. The sieve adds log2(p) at every x in [-M, M) where p divides g(x).
+# Each smooth g(x) (or smooth bar one large prime, paired up later) is a relation
+# u^2 = Q(x) (mod N); GF(2) elimination on the exponent parities then gives X^2 = Y^2.
+#############################
+# (up to digits, factor base size, M)
+SIQS_PARAMS = [(34, 200, 65536), (36, 300, 65536), (38, 400, 65536), (40, 500, 65536),
+               (42, 600, 65536), (44, 700, 65536), (48, 1000, 65536), (52, 1200, 65536),
+               (56, 2000, 196608), (60, 4000, 196608), (66, 6000, 196608), (74, 10000, 196608),
+               (80, 30000, 196608), (88, 50000, 196608), (1000, 60000, 589824)]
+SIQS_DIGITS = 30     # AutoFactor only tries SIQS from this size
+SIQS_SMALL = 20      # primes below this are trial divided but not sieved
+SIQS_T = 2.0         # sieve threshold is log2(max g(x)) - SIQS_T * log2(largest prime)
+SIQS_EXTRA = 20      # relations wanted beyond the factor base size
+SIQS_AS = 2          # values of a per sieving task
+SIQS_STATE = {}
+
+# Tonelli-Shanks: r with r*r = n (mod p), given that n is a square mod the odd prime p
+def SqrtModPrime(n, p):
+    n %= p
+    if p == 2 or n == 0:
+        return n
+    if p % 4 == 3:
+        return pow(n, (p + 1) // 4, p)
+    q = p - 1
+    s = 0
+    while q % 2 == 0:
+        q //= 2
+        s += 1
+    z = 2
+    while pow(z, (p - 1) // 2, p) != p - 1:
+        z += 1
+    m, c, t, r = s, pow(z, q, p), pow(n, q, p), pow(n, (q + 1) // 2, p)
+    while t != 1:
+        i = 0
+        t2 = t
+        while t2 != 1:
+            t2 = t2 * t2 % p
+            i += 1
+        b = pow(c, 1 << (m - i - 1), p)
+        m, c, t, r = i, b * b % p, t * b * b % p, r * b % p
+    return r
+
+def SIQSParams(N):
+    digits = len(str(N))
+    for maxdigits,fbsize,M in SIQS_PARAMS:
+        if digits <= maxdigits:
+            return fbsize, M
+
+# Factor base: 2 and the odd primes p for which N is a square mod p.
+# Returns (factor base, None) or (None, p) if a factor base prime divides N.
+def SIQSFactorBase(N, fbsize):
+    fb = []
+    limit = 4 * fbsize * max(2, int(math.log(fbsize)))
+    for p in primes.sieve_primes(limit).tolist():
+        if N % p == 0:
+            return None, p
+        if p == 2 or pow(N % p, (p - 1) // 2, p) == 1:
+            fb.append(p)
+            if len(fb) == fbsize:
+                break
+    return fb, None
+
+# Sets SIQS_STATE, called in the parent and as the initializer of each pool worker
+def SIQSInit(N, fb, M):
+    global SIQS_STATE
+    fbarr = np.array(fb, dtype=np.int64)
+    pmax = fb[-1]
+    target = math.isqrt(2 * N) // M
+    lo = max(1, len(fb) // 8)
+    hi = max(lo + 2, len(fb) // 2)
+    s = max(1, round(math.log(target) / math.log(fb[(lo + hi) // 2])))
+    SIQS_STATE = {
+        'N': N,
+        'M': M,
+        'fb': fbarr,
+        'fblist': fb,
+        'tsqrt': np.array([SqrtModPrime(N, p) for p in fb], dtype=np.int64),
+        'logp': [int(round(math.log2(p))) for p in fb],
+        'target': target,
+        'alo': lo,
+        'ahi': hi,
+        's': s,
+        'thresh': int(math.log2(M * math.isqrt(N)) - SIQS_T * math.log2(pmax)),
+        'large': pmax * 64,
+    }
+
+# a close to sqrt(2N)/M: s-1 random primes from the middle of the factor base,
+# then the prime which brings the product nearest the target
+def SIQSChooseA(rng):
+    st = SIQS_STATE
+    fb = st['fblist']
+    lo, hi, s = st['alo'], st['ahi'], st['s']
+    while True:
+        qidx = rng.sample(range(lo, hi), s - 1)
+        prod = 1
+        for i in qidx:
+            prod *= fb[i]
+        j = bisect.bisect_left(fb, st['target'] // prod, lo, hi)
+        j = min(max(j, lo), hi - 1)
+        if j not in qidx:
+            return prod * fb[j], sorted(qidx + [j])
+
+# Yields (b, soln1, soln2) for the 2^(s-1) polynomials of a, soln1/2 being the
+# roots of g(x) mod each factor base prime (meaningless for the primes of a)
+def SIQSPolynomials(a, qidx):
+    st = SIQS_STATE
+    N, fb, tsqrt = st['N'], st['fb'], st['tsqrt']
+    B = []
+    for l in qidx:
+        q = st['fblist'][l]
+        aq = a // q
+        gamma = int(tsqrt[l]) * pow(aq % q, -1, q) % q
+        if gamma > q // 2:
+            gamma = q - gamma
+        B.append(aq * gamma)
+    b = sum(B)
+    amod = ResiduesModPrimes(a, fb).astype(np.int64)
+    ainv = np.array([pow(am, -1, p) if am else 0 for am,p in zip(amod.tolist(), st['fblist'])], dtype=np.int64)
+    bmod = ResiduesModPrimes(b, fb).astype(np.int64)
+    soln1 = ainv * (tsqrt - bmod) % fb
+    soln2 = ainv * (-tsqrt - bmod) % fb
+    Bainv2 = [2 * ResiduesModPrimes(Bl, fb).astype(np.int64) * ainv % fb for Bl in B]
+    yield b, soln1, soln2
+    for i in range(1, 2**(len(qidx) - 1)):
+        v = (i & -i).bit_length()                      # b_i+1 = b_i + 2 * (-1)^ceil(i/2^v) * B_v
+        if ((i >> v) + 1) % 2 == 1:
+            b -= 2 * B[v-1]
+            soln1 = (soln1 + Bainv2[v-1]) % fb
+            soln2 = (soln2 + Bainv2[v-1]) % fb
+        else:
+            b += 2 * B[v-1]
+            soln1 = (soln1 - Bainv2[v-1]) % fb
+            soln2 = (soln2 - Bainv2[v-1]) % fb
+        yield b, soln1, soln2
 
+# g(x) over the factor base: returns ([(index, exponent), ...], cofactor) where
+# index 0 is the sign and index j is the factor base prime fb[j-1]; the primes of a
+# are included once more since Q(x) = a * g(x)
+def SIQSTrialDivide(a, b, qidx, x, soln1, soln2):
+    st = SIQS_STATE
+    N, fb, fblist = st['N'], st['fb'], st['fblist']
+    c = (b * b - N) // a
+    g = (a * x + 2 * b) * x + c
+    exps = {}
+    if g < 0:
+        exps[0] = 1
+        g = -g
+    xm = x % fb
+    hits = set(np.flatnonzero((xm == soln1) | (xm == soln2)).tolist()) | set(qidx)
+    for j in hits:
+        p = fblist[j]
+        e = 1 if j in qidx else 0
+        while g % p == 0:
+            g //= p
+            e += 1
+        if e > 0:
+            exps[j+1] = e
+    return sorted(exps.items()), g
+
+# One sieving task: SIQS_AS values of a with all their polynomials.
+# Returns (full relations [(u, exps), ...], partial relations [(u, exps, large prime), ...])
+def SIQSSieveTask(seed):
+    st = SIQS_STATE
+    M, fb, fblist, logp = st['M'], st['fb'], st['fblist'], st['logp']
+    rng = random.Random(seed)
+    full = []
+    partial = []
+    for k in range(SIQS_AS):
+        a, qidx = SIQSChooseA(rng)
+        sieved = [j for j,p in enumerate(fblist) if p >= SIQS_SMALL and j not in qidx]
+        sievep = [fblist[j] for j in sieved]
+        sievel = [logp[j] for j in sieved]
+        for b, soln1, soln2 in SIQSPolynomials(a, qidx):
+            sieve = np.zeros(2 * M, dtype=np.uint8)
+            r1s = ((soln1 + M) % fb)[sieved].tolist()
+            r2s = ((soln2 + M) % fb)[sieved].tolist()
+            for p,lp,r1,r2 in zip(sievep, sievel, r1s, r2s):
+                sieve[r1::p] += lp
+                if r2 != r1:
+                    sieve[r2::p] += lp
+            for i in np.flatnonzero(sieve >= st['thresh']).tolist():
+                x = i - M
+                exps, cofactor = SIQSTrialDivide(a, b, qidx, x, soln1, soln2)
+                if cofactor == 1:
+                    full.append((a * x + b, exps))
+                elif cofactor < st['large']:
+                    partial.append((a * x + b, exps, cofactor))
+    return full, partial
+
+# Dependencies between rows (ints used as GF(2) bit vectors) by incremental Gaussian
+# elimination; each dependency is an int whose set bits are the row numbers to combine
+def GF2Dependencies(rows):
+    pivots = {}
+    deps = []
+    for i,row in enumerate(rows):
+        history = 1 << i
+        while row:
+            col = row.bit_length() - 1
+            if col not in pivots:
+                pivots[col] = (row, history)
+                break
+            prow, phistory = pivots[col]
+            row ^= prow
+            history ^= phistory
+        if row == 0:
+            deps.append(history)
+    return deps
+
+# relations are [(u, exps, extra), ...] with u^2 = extra^2 * sign * product of p^e (mod N)
+def SIQSSquareRoots(N, fblist, relations):
+    rows = []
+    for u,exps,extra in relations:
+        row = 0
+        for j,e in exps:
+            if e & 1:
+                row |= 1 << j
+        rows.append(row)
+    for history in GF2Dependencies(rows):
+        X = 1
+        Y = 1
+        E = {}
+        while history:
+            low = history & -history
+            u, exps, extra = relations[low.bit_length() - 1]
+            history ^= low
+            X = X * u % N
+            Y = Y * extra % N
+            for j,e in exps:
+                E[j] = E.get(j, 0) + e
+        for j,e in E.items():
+            if j > 0:
+                Y = Y * pow(fblist[j-1], e // 2, N) % N
+        g = math.gcd(X - Y, N)
+        if 1 < g < N:
+            return g
+    return None
+
+def SIQSMerge(exps1, exps2):
+    E = dict(exps1)
+    for j,e in exps2:
+        E[j] = E.get(j, 0) + e
+    return sorted(E.items())
+
+# Returns a non-trivial factor of N (odd, not a prime power) or None after timeout seconds.
+# Sieving is shared out over a process pool unless processes=1 (processes=None uses every cpu).
+def SIQSFactor(N, processes=None, timeout=None, seed=None):
+    deadline = None if timeout is None else time.time() + timeout
+    fbsize, M = SIQSParams(N)
+    fb, p = SIQSFactorBase(N, fbsize)
+    if fb is None:
+        return p if p < N else None
+    SIQSInit(N, fb, M)
+    rng = random.Random(seed)
+    seeds = iter(lambda: rng.getrandbits(64), None)
+    need = len(fb) + 1 + SIQS_EXTRA
+    relations = {}
+    partials = {}
+    pool = None
+    if processes != 1:
+        pool = mp.Pool(processes, initializer=SIQSInit, initargs=(N, fb, M))
+        results = pool.imap_unordered(SIQSSieveTask, seeds)
+    else:
+        results = map(SIQSSieveTask, seeds)
+    try:
+        while True:
+            for full,partial in results:
+                for u,exps in full:
+                    relations[u] = (u, exps, 1)
+                for u,exps,large in partial:
+                    if large not in partials:
+                        partials[large] = (u, exps)
+                    elif partials[large][0] != u:
+                        u2, exps2 = partials[large]
+                        relations[u * u2 % N] = (u * u2 % N, SIQSMerge(exps, exps2), large)
+                if len(relations) >= need or (deadline is not None and time.time() > deadline):
+                    break
+            if len(relations) < need:
+                return None
+            g = SIQSSquareRoots(N, fb, list(relations.values()))
+            if g is not None:
+                return g
+            need += SIQS_EXTRA                          # only trivial dependencies, sieve some more
+    finally:
+        if pool is not None:
+            pool.terminate()
+
+
+# NOTE: rho and p-1 only get a short slice of the budget, ECM finds
+#       factors above ~12 digits much sooner than a long rho run would.
+#       From SIQS_DIGITS on ECM only gets a short slice too, to catch unbalanced
+#       factors, and SIQS (run time set by the size of N alone) has the rest.
+FACTOR_METHODS = [
+    ("fermat", lambda N, timeout, processes: FermatFactor(N, steps=10000)),
+    ("rho",    lambda N, timeout, processes: PollardRhoBrent(N, timeout=min(timeout/30, 2.0))),
+    ("p-1",    lambda N, timeout, processes: PollardPm1(N, timeout=min(timeout/30, 2.0))),
+    ("ecm",    lambda N, timeout, processes: ECMEscalate(N, timeout={True:min(timeout/10, 10.0), False:timeout}[len(str(N)) >= SIQS_DIGITS])),
+    ("siqs",   lambda N, timeout, processes: SIQSFactor(N, processes=processes, timeout=timeout) if len(str(N)) >= SIQS_DIGITS else None),
+]
+
+# Automatic strategy: trial division first, then for every composite cofactor
+# try (in order) a perfect square, a short Fermat run, rho, p-1, ECM and SIQS.
+# Returns the sorted prime factors (one may be composite if everything gave up)
+# and a report [(method, factor or None, seconds), ...] for every method tried.
+# timeout is the budget for the whole number, once it's spent any composite
+# cofactor left is returned as it is with a "timeout" entry in the report.
+# processes is passed on to SIQS (1 = no pool, None = every cpu).
+def AutoFactor(N, timeout=60.0, trial=10000, processes=1):
+    report = []
+    secs = time.time()
+    deadline = secs + timeout
+    factors, N = TrialDivision(N, limit=trial)
+    if factors:
+        report.append(("trial", list(factors), time.time() - secs))
+    stack = [N] if N > 1 else []
+    while stack:
+        n = stack.pop()
+        if IsProbablePrime(n):
+            factors.append(n)
+            continue
+        r = math.isqrt(n)
+        if r * r == n:
+            report.append(("square", r, 0.0))
+            stack += [r, r]
+            continue
+        for name,method in FACTOR_METHODS:
+            secs = time.time()
+            if secs >= deadline:
+                report.append(("timeout", n, 0.0))
+                factors.append(n)
+                break
+            f = method(n, deadline - secs, processes)
+            if f is not None and not 1 < f < n:
+                f = None
+            report.append((name, f, time.time() - secs))
+            if f is not None:
+                stack += [f, n // f]
+                break
+        else:
+            report.append(("failed", n, 0.0))
+            factors.append(n)
+    return sorted(factors), report
+
+
+def doAutoMethod(num):
+    print ("automatic factorisation (trial division, fermat, rho, p-1, ecm, siqs)")
+    print ("----------------------------------------------------------------------")
+    secs = time.time()
+    factors, report = AutoFactor(num, timeout=600.0, processes=None)
+    numlen = len(str(num))
+    for method,found,elapsed in report:
+        print ("%-7s %*s  %8.3fs" % (method+":", numlen, {True:"-", False:found}[found is None], elapsed))
+    print ("Found %d prime factor(s) of %d in %.3fs: %s" % (len(factors), num, time.time() - secs, factors))
+
+
+# The methods below are only demonstrations, so they give up where AutoFactor wouldn't:
+# trial division stops at BRUTE_FORCE_LIMIT and Fermat after FERMAT_STEPS steps.
+BRUTE_FORCE_LIMIT = 10**8
+FERMAT_STEPS = 10**6
 
 def doFermatMethod(num,sqroot):
     print ("fermat's factorisation (for semi-primes)")
     print ("----------------------------------------")
-    p = FermatFactor(num)
-    q = num / p
+    p = FermatFactor(num, steps=FERMAT_STEPS)
+    if p is None:
+        print ("gave up after %d steps (the factors are not close enough together)" % (FERMAT_STEPS))
+        return
+    q = num // p
     numlen = len(str(num))
     print ("FP:  %*d" % (numlen, p))
     print ("FQ:  %*d" % (numlen, q))
@@ -51,74 +683,173 @@ def doFermatMethod(num,sqroot):
 def doBruteForceMethod1(num,sqroot):
     print ("brute force factorisation method 1 (for numbers with multiple factors)")
     print ("----------------------------------------------------------------------")
-    try:
-        factors = set(reduce(list.__add__,([i, num//i] for i in range(2, sqroot+1) if num % i == 0)))
-        print ("Found %d factor(s) of %d (excluding 1 and %d): %s" % (len(factors), num, num, sorted(factors)))
-    except:
-        print ("Found 0 factor(s) of %d (excluding 1 and %d): %s" % (num, num, []))
+    limit = min(sqroot, BRUTE_FORCE_LIMIT)
+    primefactors, cofactor = TrialDivision(num, limit=limit, processes=None)
+    if cofactor > 1:
+        print ("gave up at %d: cofactor %d has no factor up to there, found: %s" % (limit, cofactor, primefactors))
+        return
+    factors = AllDivisors(primefactors)[1:-1]
+    print ("Found %d factor(s) of %d (excluding 1 and %d): %s" % (len(factors), num, num, factors))
 
 def doBruteForceMethod2(num,sqroot,debug=0):
     print ("brute force factorisation method 2 (for numbers with multiple factors)")
     print ("----------------------------------------------------------------------")
-    factors = []
-    sqroot += 2
     numlen = len(str(num))
     print ("NUM: %*d" % (numlen, num))
-    for p in range(2,sqroot+1):
-        if num % p == 0:
-            q = num / p
-            print ("P:   %*d" % (numlen, p))
-            print ("Q:   %*d" % (numlen, q))
-            factors.append(p)
-            factors.append(q)
-
-        if debug > 0 and (p % (sqroot/debug)) == 0:
-            print ("fraction done: %d of %d" % (p,sqroot))
-    factors = set(factors)
-    factorslen = len(factors)
-    factorsordered = list(map(int, sorted(factors)))
+    progress = None
+    if debug > 0:
+        progress = ProgressPrinter(debug)
+    limit = min(sqroot, BRUTE_FORCE_LIMIT)
+    primefactors, cofactor = TrialDivision(num, limit=limit, processes=None, progress=progress)
+    if cofactor > 1:
+        print ("gave up at %d: cofactor %d has no factor up to there, found: %s" % (limit, cofactor, primefactors))
+        return
+    factorsordered = AllDivisors(primefactors)[1:-1]
+    for p in factorsordered:
+        if p * p > num:
+            break
+        print ("P:   %*d" % (numlen, p))
+        print ("Q:   %*d" % (numlen, num // p))
+    factorslen = len(factorsordered)
     print ("Found %d factor(s) of %d (excluding 1 and %d): %s" % (factorslen, num, num, factorsordered))
     if factorslen >= 3:
         flen = int(factorslen/2)
         print ("Factors (len/2)-1,len/2,(len/2)+1 after sorting: %d,%d,%d" % (factorsordered[flen-1], factorsordered[flen],factorsordered[flen+1]))
-            
-
-if len(sys.argv) == 2:
-    num = int(sys.argv[1])
-elif len(sys.argv) == 3:
-    p = int(sys.argv[1])
-    q = int(sys.argv[2])
-    num = int(p*q)
-else:
+
+
+# Batch mode: one JSON line per number, in input order, eg.
+# {"num": 15, "factors": [3, 5], "complete": true, "method": ["trial"], "elapsed": 0.001}
+# "complete" is false when the time budget ran out with a composite factor left.
+# A line that can't be factored gives {"num": <number or field>, "error": <reason>}.
+def BatchFactor(args):
+    num, error, timeout = args
+    if error is not None:
+        return {"num": num, "error": error}
+    secs = time.time()
+    try:
+        factors, report = AutoFactor(num, timeout=timeout)
+    except Exception as e:
+        return {"num": num, "error": "%s: %s" % (type(e).__name__, e)}
+    return {"num": num,
+            "factors": factors,
+            "complete": all(IsProbablePrime(f) for f in factors),
+            "method": [method for method,found,elapsed in report if found is not None and method not in ("failed", "timeout")],
+            "elapsed": round(time.time() - secs, 6),
+           }
+
+# (num, None) or (num or field, reason) when it can't be factored: only exact integers
+# are taken, or floats which are exactly integers no bigger than 2^53 (above that a
+# float like numpy.savetxt's default %.18e is already rounded)
+def ParseNumber(field):
+    try:
+        num = int(field)
+    except ValueError:
+        try:
+            f = float(field)
+        except ValueError:
+            return field, "not a number"
+        if not f.is_integer() or abs(f) > 2**53:
+            return field, "not an exact integer"
+        num = int(f)
+    if num < 2:
+        return num, "less than 2"
+    return num, None
+
+# Numbers are the first field (space or comma separated) of each line, as written by
+# eg. numpy.savetxt of mkarrays.mkspsmodarray; blank lines and # comments are skipped.
+# Yields (num, error) as ParseNumber, with a warning on stderr for each error.
+def ReadNumbers(fd):
+    for lineno,line in enumerate(fd, 1):
+        line = line.strip()
+        if line == "" or line.startswith("#"):
+            continue
+        field = line.replace(",", " ").split()[0]
+        num, error = ParseNumber(field)
+        if error is not None:
+            sys.stderr.write("WARNING: line %d: %s: %s\n" % (lineno, field, error))
+        yield num, error
+
+def doBatchMethod(path, timeout=60.0, processes=None):
+    fd = sys.stdin if path == "-" else open(path)
+    tasks = ((num, error, timeout) for num,error in ReadNumbers(fd))
+    try:
+        if processes == 1:
+            results = map(BatchFactor, tasks)
+            for result in results:
+                print (json.dumps(result))
+                sys.stdout.flush()
+        else:
+            with mp.Pool(processes) as pool:
+                for result in pool.imap(BatchFactor, tasks):
+                    print (json.dumps(result))
+                    sys.stdout.flush()
+    finally:
+        if fd is not sys.stdin:
+            fd.close()
+
+
+def usage():
     print ("")
     print (" usage: factor p")
     print (" usage: factor p q [debug]")
+    print (" usage: factor --batch [file|-] [timeout] [workers]")
     print ("")
     print (" Either factor p or create semiprime with p and q and try factoring algorithms")
     print ("")
+    print (" --batch reads numbers from file (or - for stdin, the default) and factors them")
+    print (" over a pool of workers (default: one per cpu) allowing timeout seconds each")
+    print (" (default: 60); results are written as JSON lines in input order.")
+    print (" Lines which are not an integer >= 2 give a JSON line with an \"error\" key.")
+    print ("")
     sys.exit(2)
 
 
-sqroot = int(math.sqrt(num))  # OR: sqroot = pow(num, 0.5)
-debug = 0
-if len(sys.argv) == 4:
-    debug = int(sys.argv[3])
-numlen = len(str(num))
-print ("")
-print ("number and square")
-print ("-----------------")
-print ("NUM: %*d" % (numlen, num))
-print ("SQR: %*d" % (numlen, sqroot))
-print ("")
-#doFermatMethod(num,sqroot)
-if debug > 0:
+def main(argv):
+    if len(argv) >= 2 and argv[1] in ("-b", "--batch"):
+        path = argv[2] if len(argv) >= 3 else "-"
+        timeout = float(argv[3]) if len(argv) >= 4 else 60.0
+        processes = int(argv[4]) if len(argv) >= 5 else None
+        doBatchMethod(path, timeout=timeout, processes=processes)
+        return
+
+    debug = 0
+    if len(argv) == 2:
+        num = int(argv[1])
+    elif len(argv) == 3 or len(argv) == 4:
+        p = int(argv[1])
+        q = int(argv[2])
+        num = int(p*q)
+        if len(argv) == 4:
+            debug = int(argv[3])
+    else:
+        usage()
+
+    sqroot = math.isqrt(num)  # NOT int(math.sqrt(num)) which is inexact above 2^53
+    numlen = len(str(num))
     print ("")
-    print ("skipping brute force method 1 (which is the same as method 2 on a single line) for debug mode")
-else:
+    print ("number and square")
+    print ("-----------------")
+    print ("NUM: %*d" % (numlen, num))
+    print ("SQR: %*d" % (numlen, sqroot))
     print ("")
-    doBruteForceMethod1(num,sqroot)
-print ("")
-#doBruteForceMethod2(num,sqroot,debug=debug)
-doFermatMethod(num,sqroot)
+    doAutoMethod(num)
+    print ("")
+    #doFermatMethod(num,sqroot)
+    if debug > 0:
+        print ("")
+        print ("skipping brute force method 1 (which is the same as method 2 on a single line) for debug mode")
+        print ("")
+        doBruteForceMethod2(num,sqroot,debug=debug)
+    else:
+        print ("")
+        doBruteForceMethod1(num,sqroot)
+    print ("")
+    doFermatMethod(num,sqroot)
 
 
+if __name__ == '__main__':
+    try:
+        main(sys.argv)
+    except KeyboardInterrupt:
+        print('Aborted!')
+
@@ -21,32 +21,115 @@
  egs.
  inputs: "4"  "10 200 3 40000 5"   output: "200"
  inputs: "2"  "42"                 output: "NIL"
+
+ Benchmark (sizes 10^3 up to [maxsize], results kept in [json] and compared with the last run):
+ python linked_list.py --bench [maxsize] [json]
 """
 
+import io
+import os
 import sys
+import json
+import time
+import platform
+import tracemalloc
+from array import array
+
+CHUNK = 2**20    # bytes of the list read at a time
 
 
 def main():
     try:
-        m = intscalar(input())
-        #arr = intarray(input().strip().split())     # strip and split using white space, not single space
-        arr = intarray(list(map(int, input().strip().split())))
-        print (int(m_in_arr(m, arr)))
+        m = intscalar(sys.stdin.buffer.readline())
+        print (int(m_in_stream(m, sys.stdin.buffer)))
     except:
         print ("NIL")
 
+# reads the list line from fd chunk by chunk, keeping only the last m elements in a Ring,
+# so memory is O(m) whatever the length of the list
+def m_in_stream(m, fd, chunk=CHUNK):
+    ring = Ring(m)
+    for elems in stream_elements(fd, chunk):
+        ring.extend(elems)
+    return ring.fromend(m)
+
 # takes O(1) time (constant time) - meaning larger m -> same time
 def OLD_m_in_arr(m, arr):
     return arr[-m]
 
-# takes O(n) time (linear time) - meaning larger m -> longer time
+# takes O(n) time (linear time) to make the list, then O(1) to find the m-th from the end
 def m_in_arr(m, arr):
     myll = LL()
-    for elem in arr:
-        myll.add(elem)
+    myll.extend(arr)
     return myll.showrev(n=int(m))
 
 
+"""
+ Streaming tokenizer for input 2.
+ The line is stripped like str.strip() and split on single spaces, so a double
+ space gives an empty element, which like any non-number fails int(). Each chunk
+ is converted with array('I'), which also fails for elements outside 0..2^32-1.
+ Trailing whitespace (not just spaces, eg. the \r of a CRLF line) is held back
+ until the end of the line is seen, as it is stripped rather than split.
+"""
+
+def stream_elements(fd, chunk=CHUNK):
+    carry = b''
+    started = False
+    while True:
+        data = fd.read(chunk)
+        eol = data.find(b'\n')
+        end = eol >= 0 or len(data) == 0
+        if eol >= 0:
+            data = data[:eol]
+        data = carry + data
+        if started is False:
+            data = data.lstrip()
+            started = len(data) > 0
+        if end is True:
+            data = data.strip()
+            if len(data) > 0:
+                yield array('I', map(int, data.split(b' ')))
+            return
+        cut = data.rstrip().rfind(b' ')
+        if cut >= 0:
+            yield array('I', map(int, data[:cut].split(b' ')))
+            carry = data[cut+1:]
+        else:
+            carry = data
+
+# ring buffer of the last size elements added, in an array('I') that grows up to size
+class Ring:
+    def __init__(self, size):
+        self.size  = size
+        self.buf   = array('I')
+        self.pos   = 0          # once full, the oldest element and the next one overwritten
+        self.count = 0
+
+    def extend(self, elems):
+        self.count += len(elems)
+        room = self.size - len(self.buf)
+        if room > 0:
+            self.buf.extend(elems[:room])
+            elems = elems[room:]
+        if len(elems) >= self.size:
+            self.buf = elems[len(elems)-self.size:]
+            self.pos = 0
+        elif len(elems) > 0:
+            first = min(len(elems), self.size-self.pos)
+            self.buf[self.pos:self.pos+first] = elems[:first]
+            self.buf[:len(elems)-first] = elems[first:]
+            self.pos = (self.pos+len(elems)) % self.size
+
+    # m-th element from the end, 1 based
+    def fromend(self, m):
+        if m < 1 or m > len(self.buf):
+            raise IndexError("no element %s from the end of %d" % (m, self.count))
+        if len(self.buf) < self.size:
+            return self.buf[len(self.buf)-m]
+        return self.buf[(self.pos-m) % self.size]
+
+
 """
  Check functions
 """
@@ -73,16 +156,101 @@ def validnum(num, msg="", nmin=0, nmax=10):
 
 """
  Classes to make the linked list
+
+ LL keeps its nodes in parallel arrays: edata holds the values and enext/eprev
+ the index of the next/previous node (NIL for none), 4 bytes each per node.
+ Nodes are only ever appended, so node i is also the i-th element, which gives
+ O(1) access from either end. Values must fit 0 <= L[i] <= 2^32 - 1.
+
+ NodeLL is the original one object per element version, kept for comparison.
 """
 
+NIL = (2**32)-1
+
+class LL:
+    def __init__(self, data=()):
+        self.edata = array('I')
+        self.enext = array('I')
+        self.eprev = array('I')
+        self.start = NIL
+        self.end   = NIL
+        self.extend(data)
+
+    def __len__(self):
+        return len(self.edata)
+
+    def add(self, data):
+        e = len(self.edata)
+        self.edata.append(data)
+        self.enext.append(NIL)
+        self.eprev.append(self.end)
+        if self.start == NIL:
+            self.start = e
+        else:
+            self.enext[self.end] = e
+        self.end = e
+
+    # bulk append: the links of a run of new nodes are just consecutive indices
+    def extend(self, data):
+        e = len(self.edata)
+        self.edata.extend(data if isinstance(data, array) else array('I', data))
+        n = len(self.edata) - e
+        if n == 0:
+            return
+        self.enext.extend(range(e+1, e+n))
+        self.enext.append(NIL)
+        self.eprev.append(self.end)
+        self.eprev.extend(range(e, e+n-1))
+        if self.start == NIL:
+            self.start = e
+        else:
+            self.enext[self.end] = e
+        self.end = e+n-1
+
+    # node of the n-th element from the start (from the end if reverse), 1 based
+    def node(self, n, reverse=False):
+        if self.validnum(n) is False:
+            raise IndexError("no element %s in a list of %d" % (n, len(self)))
+        return len(self.edata)-n if reverse is True else n-1
+
+    # ll[0] is the first element, ll[-1] the last
+    def __getitem__(self, i):
+        if i < 0:
+            return self.edata[self.node(-i, reverse=True)]
+        return self.edata[self.node(i+1)]
+
+    def iterate(self, e, n=None, reverse=False):
+        if n is not None:
+            return self.edata[self.node(n, reverse)]
+        o = []
+        links = self.eprev if reverse is True else self.enext
+        while e != NIL:
+            o.append(self.edata[e])
+            e = links[e]
+        return o
+
+    def show(self, n=None):
+        return self.iterate(self.start, n=n, reverse=False)
+
+    def showrev(self, n=None):
+        return self.iterate(self.end, n=n, reverse=True)
+
+    def validnum(self, n):
+        if n is not None:
+            if n < 1 or n > len(self.edata):
+                return False
+        return True
+
+
 class Element:
+    __slots__ = ('edata', 'enext', 'eprev', 'enum')
     def __init__(self, edata, enext=None, eprev=None, enum=0):
         self.edata = edata
         self.enext = enext
         self.eprev = eprev
         self.enum  = enum
 
-class LL:
+class NodeLL:
     def __init__(self):
         self.curr  = None
         self.start = None
@@ -99,10 +267,14 @@ class LL:
             prev.enext = self.curr
             self.end   = self.curr
 
+    def extend(self, data):
+        for d in data:
+            self.add(d)
+
     def iterate(self, e, n=None, reverse=False):
         o = []
         if self.validnum(n) is False:
-            raise
+            raise IndexError("no element %s" % (n))
 
         if (n is not None) and reverse is True:
             n = e.enum - (n-1)
@@ -132,8 +304,87 @@ class LL:
         return True
 
 
+"""
+ Benchmark: times building (add/extend), traversal (show/showrev) and m-th from
+ the end lookups for each LL backend, plus m_in_arr and the streamed main input,
+ on random lists of 10^3 up to maxsize elements. Each operation is timed once,
+ then run again under tracemalloc for its peak memory.
+"""
+
+BENCH_NODEMAX = 10**6    # NodeLL needs ~100 bytes an element, so stop it here
+BENCH_JSON = "linked_list_bench.json"
+
+def bench_data(n):
+    return array('I', os.urandom(4*n))
+
+def bench_ms(n):
+    return sorted(set([1, 10, 1000, n]) & set(range(1, n+1)))
+
+def bench_op(results, backend, op, n, m, func):
+    t0 = time.perf_counter()
+    func()
+    secs = time.perf_counter() - t0
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    results.append({"backend":backend, "op":op, "n":n, "m":m, "secs":round(secs, 6), "peak":peak})
+    print ("%-7s %-11s n=%-9d m=%-9s %10.4fs %12d bytes" % (backend, op, n, m, secs, peak))
+    sys.stdout.flush()
+
+def bench_backend(results, backend, cls, data):
+    n = len(data)
+    def add():
+        ll = cls()
+        for d in data:
+            ll.add(d)
+    bench_op(results, backend, "add", n, "", add)
+    bench_op(results, backend, "extend", n, "", lambda: cls().extend(data))
+    ll = cls()
+    ll.extend(data)
+    bench_op(results, backend, "show", n, "", lambda: ll.show())
+    bench_op(results, backend, "showrev", n, "", lambda: ll.showrev())
+    for m in bench_ms(n):
+        bench_op(results, backend, "showrev(m)", n, m, lambda: ll.showrev(m))
+
+def benchmark(maxsize=10**7):
+    results = []
+    n = 10**3
+    while n <= maxsize:
+        data = bench_data(n)
+        bench_backend(results, "LL", LL, data)
+        if n <= BENCH_NODEMAX:
+            bench_backend(results, "NodeLL", NodeLL, data)
+        line = (" ".join(map(str, data)) + "\n").encode()
+        for m in bench_ms(n):
+            bench_op(results, "LL", "m_in_arr", n, m, lambda: m_in_arr(m, data))
+            bench_op(results, "Ring", "m_in_stream", n, m, lambda: m_in_stream(m, io.BytesIO(line)))
+        n *= 10
+    return results
+
+# ratio of each time to the same operation in the previous results
+def bench_compare(results, previous):
+    old = dict(((r["backend"], r["op"], r["n"], r["m"]), r["secs"]) for r in previous)
+    for r in results:
+        k = (r["backend"], r["op"], r["n"], r["m"])
+        if k in old and old[k] > 0:
+            ratio = r["secs"] / old[k]
+            print ("%-7s %-11s n=%-9d m=%-9s %6.2fx%s" % (r["backend"], r["op"], r["n"], r["m"], ratio, " SLOWER" if ratio > 1.5 else ""))
+
+def bench_main(maxsize, path):
+    results = benchmark(maxsize)
+    if os.path.exists(path):
+        print ("compared with %s:" % (path))
+        bench_compare(results, json.load(open(path))["results"])
+    with open(path, "w") as fd:
+        json.dump({"date":time.strftime("%Y-%m-%d %H:%M:%S"), "python":platform.python_version(), "results":results}, fd, indent=1)
+
+
 if __name__ == '__main__':
     try:
+        if len(sys.argv) >= 2 and sys.argv[1] == "--bench":
+            bench_main(int(float(sys.argv[2])) if len(sys.argv) >= 3 else 10**7, sys.argv[3] if len(sys.argv) >= 4 else BENCH_JSON)
+            sys.exit(0)
         main()
     except KeyboardInterrupt:
         print('Aborted!')
@@ -14,6 +14,7 @@ lltest1 = [0,1,2,3,4,5,6,7,8,9]
 lltest2 = range(0,2**16)
 lltest3 = range(0,2**20)
 lltest4 = range(0,2**32)
+lltest5 = range(0,10**7)
 
 # put this test in TestLL class:
 #   self.assertEqual(OLD_output_m_in_arr(2, lltest4), '4294967294\n')
@@ -34,6 +35,26 @@ class TestLL(unittest.TestCase):
         self.assertEqual(linked_list.OLD_m_in_arr(2, lltest3), 1048574)
         self.assertEqual(linked_list.OLD_m_in_arr(1, lltest4), 4294967295)
         #self.assertEqual(linked_list.m_in_arr(2, lltest4), 4294967294)
+        self.assertEqual(linked_list.m_in_arr(1, lltest5), 9999999)
+        self.assertEqual(linked_list.m_in_arr(10**7, lltest5), 0)
+        self.assertRaises(IndexError, linked_list.m_in_arr, 11, lltest1)
+
+    def test_LL(self):
+        myll = linked_list.LL(lltest1)
+        myll.add(10)
+        myll.extend([11,12])
+        self.assertEqual(len(myll), 13)
+        self.assertEqual(myll[0], 0)
+        self.assertEqual(myll[-1], 12)
+        self.assertEqual(myll.show(4), 3)
+        self.assertEqual(myll.showrev(4), 9)
+        self.assertEqual(myll.showrev(), list(range(12,-1,-1)))
+
+    def test_m_in_stream(self):
+        for chunk in [1,2,3,4,linked_list.CHUNK]:
+            self.assertEqual(linked_list.m_in_stream(2, io.BytesIO(b' 1 2 3\n'), chunk), 2)
+            self.assertEqual(linked_list.m_in_stream(1, io.BytesIO(b'1  \r\n'), chunk), 1)
+            self.assertEqual(linked_list.m_in_stream(1, io.BytesIO(b'7 8 \t\r\n9\n'), chunk), 8)
 
 if __name__ == '__main__':
     unittest.main()
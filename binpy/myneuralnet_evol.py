@@ -21,6 +21,10 @@ import pickle
 import random
 import itertools
 import multiprocessing as mp
+import verbose
+
+TIMING_SECONDS = 60    # how often each job writes its own timings at verbose level 3 or "timing"
+STATUS_QUEUE = 1000    # status lines a job queues for its writer thread before dropping them
 
 
 @click.command()
@@ -41,12 +45,16 @@ import multiprocessing as mp
 @click.option('-lr', '--learnrate',  default=0.1,   show_default=True, help='Learn rate on back progagation calculations',)
 @click.option('-ld', '--learndecay', default=1.0,   show_default=True, help='Learn rate decay after each iteration',)
 @click.option('-sn', '--seconds',    default=5,     show_default=True, help='Seconds between updates',)
+@click.option('-vs', '--validsecs',  default=30,    show_default=True, help='Seconds between validation passes shown in the updates (0 for every update)',)
+@click.option('-vq', '--validqty',   default=0,     show_default=True, help='Validate on a random subsample of this size (0 for all)',)
 @click.option('-pv', '--percvalid',  default=10,    show_default=True, help='Percentage of input which is validation',)
 @click.option('-pa', '--parallel',   default=10,    show_default=True, help='Number of parallel neural nets created',)
 @click.option('-ev', '--evols',      default=10,    show_default=True, help='Number of evolutions using mutations of the best 2 results',)
 @click.option('-sw', '--swaps',      default=50,    show_default=True, help='Percentage of random alleles swapped in top performers',)
 @click.option('-mu', '--mutations',  default=5,     show_default=True, help='Percentage of random alleles (cistrons) mutated in top performers',)
-def main(sumtype, train, loadtrain, lastrun, bestjob, predict, checkjob, inputqty, hfactor, ifactor, batch, dropout, epochs, loops, learnrate, learndecay, seconds, percvalid, parallel, evols, swaps, mutations):
+@click.option('-lg', '--logto',      default='',    help='Send job status lines through one writer to this file (- for stdout)',)
+@click.option('-vb', '--verbosity',  default='1',   show_default=True, help='Verbose levels, eg. "2" or "1,timing" to show timings (status lines are level 1)',)
+def main(sumtype, train, loadtrain, lastrun, bestjob, predict, checkjob, inputqty, hfactor, ifactor, batch, dropout, epochs, loops, learnrate, learndecay, seconds, validsecs, validqty, percvalid, parallel, evols, swaps, mutations, logto, verbosity):
     """
     \b
     1. Make a neural network with fixed hidden layers.
@@ -74,11 +82,14 @@ def main(sumtype, train, loadtrain, lastrun, bestjob, predict, checkjob, inputqt
     ... --sumtype=add -tn -st=add -sn=2 -lr=0.001 -ld=1.0001 -dr=0 -iq=20000 -pv=1 -lo=2000 -bt=0 -pa=1 -ep=20 -ev=1
     """
     init()
+    verbose.setLevels(verbosity)
     argsd = locals()
 
     if train is True or loadtrain is True:
+        log_start(logto)
         evolution_training = Train(argsd)
         evolution_training.etraining()
+        log_stop(logto)
 
     elif lastrun is True:
         terrs, verrs = get_lastrun(sumtype)
@@ -141,6 +152,8 @@ class Train():
         self.learnrate  = argsd['learnrate']
         self.learndecay = argsd['learndecay']
         self.seconds    = argsd['seconds']
+        self.validsecs  = argsd.get('validsecs', 0)
+        self.validqty   = argsd.get('validqty', 0)
         self.percvalid  = argsd['percvalid']
         self.parallel   = argsd['parallel']
         self.evols      = argsd['evols']
@@ -155,6 +168,7 @@ class Train():
         for evol in range(self.evols):
             self.jobs    = jobs_run(self.parallel, self.training, evol)
             jobs_check(self.jobs, self.returnd)
+            print_timings(evol, self.returnd, self.parallel)
             self.topnnd  = top_jobs(self.topnnd, self.topqty, self.returnd, self.parallel)
             print_top_nns(self.topnnd, self.topqty, self.train_x, self.train_y, self.valid_x, self.valid_y)
             self.returnd = mutate_top_jobs(self.topnnd, self.topqty, self.returnd, self.parallel, self.swaps, self.mutations)
@@ -163,6 +177,7 @@ class Train():
             print_bestjob(self.sumtype) # CHECK
 
     def training(self, evol, jobnum):
+        verbose.timerReset()
         if self.train is True:
             self.neural_network = NeuralNetwork(self.sizein*self.ifactor, self.sizein*self.hfactor, self.sizeout, rseed=random.randint(1,self.parallel*100))
         elif self.loadtrain is True:
@@ -170,7 +185,13 @@ class Train():
         else:
             self.neural_network = self.returnd[jobnum]['neural_network']
 
+        if verbose.vchannel is None:
+            verbose.setStream(sys.stdout)
+            verbose.startAsync(STATUS_QUEUE, "drop")
+
         secs = time.time()
+        vsecs = 0
+        valid = None
         trainqty = self.train_x.shape[0]
         batchinc = {True:trainqty, False:self.batch}[self.batch == 0]
 
@@ -178,14 +199,33 @@ class Train():
             for batchstart in range(0, trainqty, batchinc):
                 batch_x = self.train_x[batchstart:batchstart+batchinc]  # :<to> field may often exceed the array
                 batch_y = self.train_y[batchstart:batchstart+batchinc]  #   this is not a problem for Python
-                err = self.neural_network.train(batch_x, batch_y, self.loops, dropout=self.dropout, learnrate=self.learnrate, learndecay=self.learndecay)
-                secs = print_status(evol, jobnum, secs, self.seconds, self.neural_network, batchstart, self.batch, self.inputqty, epoch+1, self.epochs, self.loops, self.dropout, self.learnrate, self.learndecay, batch_x, batch_y, self.valid_x, self.valid_y)
-                save_nn(gen_filenn(self.sumtype,jobnum), self.neural_network)
+                terrs = self.neural_network.train(batch_x, batch_y, self.loops, dropout=self.dropout, learnrate=self.learnrate, learndecay=self.learndecay)
+                if time.time() > secs+self.seconds and time.time() > vsecs+self.validsecs:
+                    with verbose.Timer("validate"):
+                        valid = self.validate()
+                    vsecs = time.time()
+                with verbose.Timer("print_status"):
+                    secs = print_status(evol, jobnum, secs, self.seconds, self.neural_network, batchstart, self.batch, self.inputqty, epoch+1, self.epochs, self.loops, self.dropout, self.learnrate, self.learndecay, terrs, valid)
+                with verbose.Timer("save_nn"):
+                    save_nn(gen_filenn(self.sumtype,jobnum), self.neural_network)
+                verbose.counter("batches")
+                verbose.timerDump([3,"timing"], TIMING_SECONDS, title="%d-%d timings" % (evol, jobnum))
 
         self.returnd[jobnum] = { 'neural_network': self.neural_network,
                                  'verr': get_err(self.neural_network, self.valid_x, self.valid_y),
                                  'terr': get_err(self.neural_network, self.train_x, self.train_y),
+                                 'timers': verbose.timerState(),
                                }
+        verbose.stopAsync()
+
+    # validation err/L/H on valid_x, or on a random validqty of it
+    def validate(self):
+        valid_x, valid_y = self.valid_x, self.valid_y
+        if 0 < self.validqty < valid_x.shape[0]:
+            idx = np.random.choice(valid_x.shape[0], self.validqty, replace=False)
+            valid_x, valid_y = valid_x[idx], valid_y[idx]
+        pred_y, err_y, verr, vLerr, vHerr = self.neural_network.dthink(valid_x, valid_y)
+        return verr, vLerr, vHerr
 
 
 """
@@ -227,21 +267,25 @@ class NeuralNetwork():
     # w3_to_4 = weights for n3 - n4 (n4 = output)
     # d4 = difference between guess and training output
     # d3 = difference between last difference (d4) and w2_to_3
+    # returns the mean error over the loops, plus the low/high error counts of the last loop
     def train(self, train_x, train_y, loops, dropout=0, learnrate=1.0, learndecay=1.0):
         sumerror_y = 0
         n1 = train_x
         for loop in range(loops):                                         # EG. sizein=8 sizelayer=16 sizeout=8 inputs/outputs=100
-            n2, n3, n4 = self.tthink(n1, dropout=dropout)                 # 100x16, 8x100 = think(100x8)
-            error_y = train_y - n4                                        # we want error_y close to 0
-            sumerror_y += error_y
-            d4 = error_y * self.squashgradient(n4)                        # 100x8  =    (100x8 - 100x8) * 100x8
-            d3 = np.dot(d4, self.w3_to_4.T) * self.squashgradient(n3)     # 100x16 = dot(100x8    8x16) * 100x16
-            d2 = np.dot(d3, self.w2_to_3.T) * self.squashgradient(n2)     # 100x16 = dot(100x8    8x16) * 100x16
-            self.w1_to_2 += np.dot(n1.T, d2) * learnrate                  # 8x16  += dot(8x100  100x16)
-            self.w2_to_3 += np.dot(n2.T, d3) * learnrate                  # 16x8  += dot(16x100 100x8)
-            self.w3_to_4 += np.dot(n3.T, d4) * learnrate                  # 16x8  += dot(16x100 100x8)
+            with verbose.Timer("forward"):
+                n2, n3, n4 = self.tthink(n1, dropout=dropout)             # 100x16, 8x100 = think(100x8)
+            with verbose.Timer("backward"):
+                error_y = train_y - n4                                    # we want error_y close to 0
+                sumerror_y += error_y
+                d4 = error_y * self.squashgradient(n4)                    # 100x8  =    (100x8 - 100x8) * 100x8
+                d3 = np.dot(d4, self.w3_to_4.T) * self.squashgradient(n3) # 100x16 = dot(100x8    8x16) * 100x16
+                d2 = np.dot(d3, self.w2_to_3.T) * self.squashgradient(n2) # 100x16 = dot(100x8    8x16) * 100x16
+            with verbose.Timer("update"):
+                self.w1_to_2 += np.dot(n1.T, d2) * learnrate              # 8x16  += dot(8x100  100x16)
+                self.w2_to_3 += np.dot(n2.T, d3) * learnrate              # 16x8  += dot(16x100 100x8)
+                self.w3_to_4 += np.dot(n3.T, d4) * learnrate              # 16x8  += dot(16x100 100x8)
             learnrate = self.decay(learnrate, learndecay)                 # TO DO: should I include loop?
-        return np.mean(abs(sumerror_y)/loops)
+        return np.mean(abs(sumerror_y)/loops), np.count_nonzero(error_y<-0.999), np.count_nonzero(error_y>0.999)
 
     def drop(self, n, dropout):
         dist = (100 - dropout) / 100        # Eg. dropout=25 keeps 75% so dist=0.75 (0 <= dist <= 1.0)
@@ -283,7 +327,7 @@ def jobs_run(parallel, runfunc, evol):
     jobs = []
     try:
         for jobnum in range(parallel):
-            job = mp.Process(target=runfunc, args=(evol, jobnum))
+            job = mp.Process(target=runfunc, args=(evol, jobnum), name="%d-%d" % (evol, jobnum))
             jobs.append(job)
             job.start()
         for job in jobs:
@@ -297,8 +341,8 @@ def jobs_run(parallel, runfunc, evol):
 def jobs_check(jobs, returnd):
     err = False
     if len(returnd) > 0:
-        for job in jobs:
-            if len(returnd[job]) == 0:
+        for job in range(len(jobs)):
+            if job not in returnd or len(returnd[job]) == 0:
                 print ("job {:d} did not complete".format(job))
                 err = True
     else:
@@ -520,22 +564,27 @@ def split_x_y(x, y, percvalid):
     trainqty = int(qty - validqty)
     return x[:trainqty], y[:trainqty], x[trainqty:], y[trainqty:]
 
+@verbose.timed("make_x_y")
 def make_x_y(sumtype, inputqty, ifactor, percvalid):
     if sumtype == "factor":
-        sums = mkarrays.mkspsmodarray(3, 3, inputqty, spmods=1, randomskip=10)
-        sums = np.squeeze(sums[np.random.shuffle(sums[:])])   # shuffle on column 0
-        sizein, sizeout = mkarrays.semiprimesbinarydigits(sums)
-        x, y = mkarrays.semiprimes2binary(sums, sizein, sizeout, multiplier=ifactor)
+        with verbose.Timer("make_x_y.sums"):
+            sums = mkarrays.mkspsmodarray(3, 3, inputqty, spmods=1, randomskip=10)
+            sums = np.squeeze(sums[np.random.shuffle(sums[:])])   # shuffle on column 0
+        with verbose.Timer("make_x_y.binary"):
+            sizein, sizeout = mkarrays.semiprimesbinarydigits(sums)
+            x, y = mkarrays.semiprimes2binary(sums, sizein, sizeout, multiplier=ifactor)
     else:
-        if sumtype == "add":
-            sums = mkarrays.mkuniqueaddarray(10, 15, inputqty, randomskip1=10, randomskip2=10)
-        elif sumtype == "mod":
-            sums = mkarrays.mkspsmodarray(3, 3, inputqty, spmods=10, randskipdig=2)
-        elif sumtype == "multiply":
-            sums = mkarrays.mkuniquemultiplicationarray(10, 10, inputqty, randomskip1=10, randomskip2=10)
-        sums = np.squeeze(sums[np.random.shuffle(sums[:])])   # shuffle on column 0
-        sizein, sizeout = mkarrays.sumsbinarydigits(sums)
-        x, y = mkarrays.sums2binary(sums, sizein, sizeout, multiplier=ifactor)
+        with verbose.Timer("make_x_y.sums"):
+            if sumtype == "add":
+                sums = mkarrays.mkuniqueaddarray(10, 15, inputqty, randomskip1=10, randomskip2=10)
+            elif sumtype == "mod":
+                sums = mkarrays.mkspsmodarray(3, 3, inputqty, spmods=10, randskipdig=2)
+            elif sumtype == "multiply":
+                sums = mkarrays.mkuniquemultiplicationarray(10, 10, inputqty, randomskip1=10, randomskip2=10)
+            sums = np.squeeze(sums[np.random.shuffle(sums[:])])   # shuffle on column 0
+        with verbose.Timer("make_x_y.binary"):
+            sizein, sizeout = mkarrays.sumsbinarydigits(sums)
+            x, y = mkarrays.sums2binary(sums, sizein, sizeout, multiplier=ifactor)
     train_x, train_y, valid_x, valid_y = split_x_y(x, y, percvalid)
     return sums, sizein, sizeout, train_x, train_y, valid_x, valid_y
 
@@ -550,15 +599,45 @@ def load_x_y(sumtype, ifactor, percvalid):
     train_x, train_y, valid_x, valid_y = split_x_y(x, y, percvalid)
     return sums, sizein, sizeout, train_x, train_y, valid_x, valid_y
 
-def print_status(evol, jobnum, secs, seconds, nnet, batchstart, batch, inputqty, epoch, epochs, loops, dropout, learnrate, learndecay, batch_x, batch_y, valid_x, valid_y):
+# terr/tL/tH come from the training loops just run and verr/vL/vH from the last
+# validation (Train.validate), so printing a status line does no extra passes
+def print_status(evol, jobnum, secs, seconds, nnet, batchstart, batch, inputqty, epoch, epochs, loops, dropout, learnrate, learndecay, terrs, valid):
     if time.time() > secs+seconds:
         secs = time.time()
         HHMM = time.strftime("%H:%M")   #("%Y,%m,%d,%H,%M,%S")
-        pred_y, err_y, terr, tLerr, tHerr = nnet.dthink(batch_x, batch_y)
-        pred_y, err_y, verr, vLerr, vHerr = nnet.dthink(valid_x, valid_y)
-        print ("%s: %d-%d) %d:%d of %d; loop/epochs/epoch=%d/%d/%d; nn=%d/%d/%d; terr/tL/tH=%1.4f/%d/%d; verr/vL/vH=%1.4f/%d/%d; dropout=%d%s; learnrate=%1.6f/%1.6f" % (HHMM, evol, jobnum, batchstart, batch, inputqty, loops, epochs, epoch, nnet.isize(), nnet.hsize(), nnet.osize(), terr, tLerr, tHerr, verr, vLerr, vHerr, dropout, "%", learnrate, learndecay))
-        sys.stdout.flush()
+        terr, tLerr, tHerr = terrs
+        verr, vLerr, vHerr = valid if valid is not None else (float('nan'), 0, 0)
+        print_log ("%s: %d-%d) %d:%d of %d; loop/epochs/epoch=%d/%d/%d; nn=%d/%d/%d; terr/tL/tH=%1.4f/%d/%d; verr/vL/vH=%1.4f/%d/%d; dropout=%d%s; learnrate=%1.6f/%1.6f" % (HHMM, evol, jobnum, batchstart, batch, inputqty, loops, epochs, epoch, nnet.isize(), nnet.hsize(), nnet.osize(), terr, tLerr, tHerr, verr, vLerr, vHerr, dropout, "%", learnrate, learndecay))
     return secs
+
+# --logto: status lines from the jobs go to the parent over verbose's channel and
+# are written there by one thread, tagged with the job's process name (evol-jobnum)
+def log_start(logto):
+    if logto != '':
+        if logto == '-':
+            verbose.setStream(sys.stdout)
+        else:
+            verbose.openFile(logto)
+        verbose.startChannel()
+
+def log_stop(logto):
+    if logto != '':
+        verbose.stopChannel()
+        verbose.closeFile()
+
+# timings of this evolution: the parent's own (make_x_y on the first) merged with every job's
+def print_timings(evol, returnd, parallel):
+    states = [verbose.timerState()] + [returnd[j]['timers'] for j in range(parallel) if j in returnd and 'timers' in returnd[j]]
+    verbose.timerSummary([2,"timing"], verbose.timerMerge(states), title="evol %d timings" % (evol))
+    verbose.timerReset()
+
+# through the channel if there is one, else through the job's own background writer
+def print_log(line):
+    if verbose.vchannel is not None or verbose.vqueue is not None:
+        verbose.verbose(1, line, labels=[])
+    else:
+        print (line)
+        sys.stdout.flush()
     
 # print_predsums(nnet, valid_x, valid_y, sumtype, sizein)
 # print_predsums(nnet, train_x, train_y, sumtype, sizein)
@@ -12,6 +12,9 @@
 import multiprocessing as mp
 import random
 import time
+import sys
+import functools
+import verbose
 
 
 
@@ -87,3 +90,20 @@ if __name__ == '__main__':
             job.terminate()
     print (returnd)
 
+
+
+"""
+ example 4
+"""
+
+# messages from every process go through verbose's channel to one writer in the parent
+print ('\nEG 4')
+def logfunc(jobnum):
+    for i in range(3):
+        verbose.verbose(1, 'process {:d}: line {:d}'.format(jobnum, i), labels=[])
+
+if __name__ == '__main__':
+    verbose.setStream(sys.stdout)
+    verbose.startChannel()
+    runInParallel(*[functools.partial(logfunc, jobnum) for jobnum in range(3)])
+    verbose.stopChannel()
@@ -10,33 +10,53 @@
 
 import os
 import sys
+import math
 import click
+import functools
 import itertools
 import random
 import gmpy2
 import numpy as np
+import multiprocessing as mp
 
 
 @click.command()
 @click.option('-v',   '--verbose',     is_flag=True,  help='Display with more information',)
 @click.option('-rsd', '--randskipdig', default=0,     show_default=True, help='use this to force non-sequencial primes',)
 @click.option('-bs',  '--base',        default=10,    show_default=True, help='base for calculating digits',)
-@click.argument('nprimes', nargs=1, type=int)
-@click.argument('digits', nargs=1, type=int)
-def main(verbose, randskipdig, base, nprimes, digits):
+@click.option('-ra',  '--randprimes',  is_flag=True,  help='Random (not next_prime) primes using batch primality tests',)
+@click.option('-mt',  '--mktable',     default='',    help='Make a binary prime table at this path (see --fromtext, --sieve)',)
+@click.option('-ft',  '--fromtext',    default='',    help='Text file of primes (one per line) used by --mktable',)
+@click.option('-sv',  '--sieve',       default=0,     show_default=True, help='Sieve primes below this limit for --mktable',)
+@click.argument('nprimes', nargs=1, type=int, default=0)
+@click.argument('digits', nargs=1, type=int, default=0)
+def main(verbose, randskipdig, base, randprimes, mktable, fromtext, sieve, nprimes, digits):
     """
     \b
     Display NPRIMES prime numbers, the length of which should be at least DIGITS digits long.
     \b
     eg1.  primes.py -v -rsd=99 10 100   # 10 primes 100 digits long (non-sequential), nice output
     eg2.  primes.py 1000000 1           # 1 million primes (20 secs), in a list
+    eg3.  primes.py -v -ra 10 2000      # 10 random primes 2000 digits long
+    eg4.  primes.py -ra 5 3             # 5 different random 3 digit primes
+    \b
+    Make the binary prime table used by getfPrimes (~/bin/primes.bin):
+    eg5.  primes.py --mktable ~/bin/primes.bin --fromtext ~/bin/primes.txt
+    eg6.  primes.py --mktable ~/bin/primes.bin --sieve 1000000000
 
     """
+    if mktable != '':
+        count = mkprimetable(mktable, txtpath=fromtext, limit=sieve)
+        print ("wrote {:d} primes to {:s}".format(count, mktable))
+        return
     #primes = get_primes_erat(10**digits,nprimes)
     #primes = getPrimes(10**digits,nprimes)
     #primes = getnPrimes(10**digits, nprimes, randomskip=arg3)
     #primes = getfPrimes(10**digits, nprimes, randomskip=arg3)
-    primes = get_n_primes_d_digits(nprimes, digits, randskipdig=randskipdig, base=base)
+    if randprimes is True:
+        primes = get_n_random_primes_d_digits(nprimes, digits, base=base)
+    else:
+        primes = get_n_primes_d_digits(nprimes, digits, randskipdig=randskipdig, base=base)
     if verbose is True:
         show_int_ilens(primes, label="next_prime")
     else:
@@ -61,6 +81,34 @@ def get_n_primes_d_digits(n, d, randskipdig=0, base=10):
         primes.append(prime)
     return primes
 
+# As above but n different random d digit primes (fewer if there aren't n of them).
+# When there are few enough d digit numbers they are all sieved and sampled from.
+# Otherwise each prime comes from its own window of odd numbers after a random start:
+# the window is sieved (sieve_window) so only a small fraction of it gets a full
+# primality test, and the survivors are tested in random order until one is prime.
+def get_n_random_primes_d_digits(n, d, base=10, width=0, processes=None):
+    low = base**(d-1)
+    high = base**d
+    if high - low <= SAMPLE_RANGE:
+        ps = sieve_range(low, high).tolist()
+        return random.sample(ps, min(n, len(ps)))
+    if width <= 0:
+        width = max(256, int(d * math.log(base)))  # for large d about 2 primes per window
+    primes = []
+    found = set()
+    while len(primes) < n:
+        start = random.randrange(low, high) | 1
+        keep = sieve_window(start, width)
+        tests = [start + 2*int(i) for i in np.flatnonzero(keep) if start + 2*int(i) < high]
+        random.shuffle(tests)
+        for candidate,isprime in zip(tests, iter_prime_tests(tests, processes=processes)):
+            if isprime is True:
+                if candidate not in found:
+                    found.add(candidate)
+                    primes.append(candidate)
+                break
+    return primes
+
 def ilen(n):
     return gmpy2.mpz(n).num_digits()
     #return len(str(abs(n)))
@@ -77,17 +125,19 @@ def show_int_ilens(numarr, label="number"):
 # NOTE: in tests I had to cycle between 100-400 possprimes for every 10 primes
 def adhoc_get_possible_prime(primesarr, n):
     primes = np.random.choice(primesarr, n)
-    primes = np.insert(primes, 0, 2)
-    pprod = str(primes.prod())
-    pmaybe = gmpy2.mpz(pprod) + 1
+    pprod = gmpy2.mpz(2)
+    for p in primes:
+        pprod *= int(p)     # NOTE: primes.prod() overflows np.ulonglong, so multiply as mpz
+    pmaybe = pprod + 1
     return pmaybe
-def adhoc_get_n_primes(n, primesarr, paqty):
+def adhoc_get_n_primes(n, primesarr, paqty, batch=100):
     primes = []
     while n > 0:
-        possprime = adhoc_get_possible_prime(primesarr, paqty)
-        if gmpy2.is_prime(possprime) is True:
-            primes.append(possprime)
-            n = n - 1
+        possprimes = [adhoc_get_possible_prime(primesarr, paqty) for i in range(batch)]
+        for possprime,isprime in zip(possprimes, batch_is_prime(possprimes)):
+            if isprime is True and n > 0:
+                primes.append(possprime)
+                n = n - 1
     return primes
 #primes_low  = np.array([3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41, 43, 47, 53, 59, 61, 67, 71, 73, 79, 83, 89, 97, 101, 103, 107, 109, 113, 127, 131, 137, 139, 149, 151, 157, 163, 167, 173], dtype=np.ulonglong)
 #primes_9dig = np.array([982450801, 982450829, 982450849, 982450871, 982450913, 982450921, 982450943, 982450967, 982450981, 982450999, 982451023, 982451081, 982451087, 982451111, 982451123, 982451159, 982451161, 982451179, 982451191, 982451219, 982451227, 982451231, 982451243, 982451321, 982451333, 982451359, 982451383, 982451419, 982451429, 982451443, 982451467, 982451479, 982451497, 982451501, 982451549, 982451567, 982451579, 982451581, 982451609, 982451629], dtype=np.ulonglong)
@@ -137,8 +187,11 @@ def getnPrimes(startnum, nprimes, randomskip=1):
         num = num + 1 + int(randomskip * random.random())
     return primes
 
+# NOTE: reads primes.txt from the start every time, so use the binary table (getmPrimes) if it exists
 def getfPrimes(start, n, randomskip=1):
     home = os.getenv('HOME')
+    if os.path.exists(home+"/bin/primes.bin"):
+        return getmPrimes(start, n, randomskip=randomskip, path=home+"/bin/primes.bin")
     primes = []
     line = 0
     nextline = 0
@@ -155,6 +208,191 @@ def getfPrimes(start, n, randomskip=1):
                         return(primes)
 
 
+#############################
+# Binary prime table: fixed-width uint64, one prime per slot, opened with np.memmap
+# so prime number i (1-based, like the line numbers of primes.txt) is table[i-1].
+# Build it once with mkprimetable() from primes.txt or from a sieve.
+#############################
+PRIMETABLE_DTYPE = np.uint64
+
+def openprimetable(path):
+    return np.memmap(path, dtype=PRIMETABLE_DTYPE, mode='r')
+
+# Same selection as getfPrimes: start at ordinal start, then skip forward by
+# max(1, int(randomskip * random)) each time - but all n ordinals are made at once
+# NOTE: returns fewer than n primes if the table runs out (getfPrimes returns None)
+def getmPrimes(start, n, randomskip=1, path=None):
+    if path is None:
+        path = os.getenv('HOME')+"/bin/primes.bin"
+    if n <= 0:
+        return []
+    table = openprimetable(path)
+    skips = np.maximum(1, (randomskip * np.random.random(n)).astype(np.int64))
+    skips[0] = 0
+    ordinals = max(start, 1) - 1 + np.cumsum(skips)
+    ordinals = ordinals[ordinals < table.shape[0]]
+    return [int(p) for p in table[ordinals]]
+
+# Odd-only sieve of Eratosthenes in segments so memory stays at segsize bytes.
+# Yields numpy arrays of the primes below limit in ascending order.
+def sieve_segments(limit, segsize=2**24):
+    if limit <= 2:
+        return
+    root = math.isqrt(limit - 1)
+    small = sieve_primes(root + 1)[1:]
+    for low in range(0, limit, 2*segsize):
+        yield sieve_range(low, min(low + 2*segsize, limit), small=small)
+
+# Primes p with low <= p < high as a numpy array; small (optional) must hold
+# the odd primes up to isqrt(high-1) so callers sieving many ranges make it once
+def sieve_range(low, high, small=None):
+    if small is None:
+        small = sieve_primes(math.isqrt(max(high - 1, 0)) + 1)[1:]
+    head = np.array([2] if low <= 2 < high else [], dtype=PRIMETABLE_DTYPE)
+    low = max(low, 3) | 1
+    if low >= high:
+        return head
+    seg = np.ones((high - low + 1) // 2, dtype=bool)    # seg[i] represents low + 2*i
+    for p in small.tolist():
+        if p*p >= high:
+            break
+        first = max(p*p, ((low + p - 1) // p) * p)
+        if first % 2 == 0:
+            first += p
+        seg[(first - low)//2::p] = False
+    return np.concatenate((head, (low + 2*np.flatnonzero(seg)).astype(PRIMETABLE_DTYPE)))
+
+# All primes below limit in a single numpy array
+def sieve_primes(limit):
+    if limit <= 2:
+        return np.array([], dtype=PRIMETABLE_DTYPE)
+    sieve = np.ones(limit//2, dtype=bool)       # sieve[i] represents 2*i+1
+    sieve[0] = False
+    for i in range(1, (math.isqrt(limit - 1) - 1)//2 + 1):
+        if sieve[i]:
+            p = 2*i + 1
+            sieve[p*p//2::p] = False
+    return np.concatenate((np.array([2], dtype=PRIMETABLE_DTYPE), (2*np.flatnonzero(sieve) + 1).astype(PRIMETABLE_DTYPE)))
+
+# Write the binary table from a text file of primes (one per line) or a sieve up to limit.
+# Returns the number of primes written.
+def mkprimetable(path, txtpath='', limit=0, chunklines=2**20):
+    count = 0
+    with open(path, "wb") as fo:
+        if txtpath != '':
+            with open(txtpath) as fd:
+                while True:
+                    lines = list(itertools.islice(fd, chunklines))
+                    if not lines:
+                        break
+                    chunk = np.array([int(l) for l in lines if l.strip() != ''], dtype=PRIMETABLE_DTYPE)
+                    chunk.tofile(fo)
+                    count += chunk.shape[0]
+        elif limit > 0:
+            for chunk in sieve_segments(limit):
+                chunk.tofile(fo)
+                count += chunk.shape[0]
+        else:
+            raise ValueError("mkprimetable needs txtpath or limit")
+    return count
+
+
+#############################
+# Batch primality: filter candidate arrays before any full test
+#   1. wheel: residues mod groups of small primes (one bigint mod per group, the rest in numpy)
+#   2. gcd with the primorial of the next band of primes
+#   3. BPSW on the survivors, spread over a process pool when the candidates are large
+# For a run of odd numbers sieve_window does 1 and 2 in one go by crossing off multiples.
+#############################
+WHEEL_BOUND = 2**10
+GCD_BOUND = 2**16
+WINDOW_BOUND = 2**20
+POOL_DIGITS = 300
+SAMPLE_RANGE = 2**20     # get_n_random_primes_d_digits samples from a full sieve up to this many numbers
+
+# groups of primes below bound whose product fits in an int64: [(product, array of primes), ...]
+@functools.lru_cache(maxsize=None)
+def wheel_groups(bound=WHEEL_BOUND):
+    groups = []
+    group = []
+    prod = 1
+    for p in sieve_primes(bound).tolist():
+        if prod * p >= 2**63:
+            groups.append((prod, np.array(group, dtype=np.int64)))
+            group = []
+            prod = 1
+        group.append(p)
+        prod *= p
+    if group:
+        groups.append((prod, np.array(group, dtype=np.int64)))
+    return groups
+
+# candidate % p for every prime in the groups, one bigint mod per group
+def wheel_residues(candidate, groups):
+    return np.concatenate([np.array([int(candidate % prod)], dtype=np.int64) % group for prod,group in groups])
+
+@functools.lru_cache(maxsize=None)
+def gcd_primorial(low=WHEEL_BOUND, high=GCD_BOUND):
+    return gmpy2.primorial(high) // gmpy2.primorial(low)
+
+# returns a numpy bool array, False where a prime below bound divides the candidate
+# NOTE: candidates must all be >= bound otherwise small primes are rejected too
+def wheel_filter(candidates, bound=WHEEL_BOUND):
+    keep = np.ones(len(candidates), dtype=bool)
+    for prod,group in wheel_groups(bound):
+        residues = np.array([int(c % prod) for c in candidates], dtype=np.int64)
+        keep &= (residues[:, np.newaxis] % group != 0).all(axis=1)
+    return keep
+
+# returns a numpy bool array for the odd numbers start, start+2, ... start+2*(width-1),
+# False where a prime below bound (and below the root of the last number) properly
+# divides the number (start must be odd)
+def sieve_window(start, width, bound=WINDOW_BOUND):
+    groups = wheel_groups(bound)
+    ps = np.concatenate([group for prod,group in groups])[1:]     # odd primes only
+    rs = wheel_residues(start, groups)[1:]
+    used = ps <= math.isqrt(start + 2*(width-1))
+    ps,rs = ps[used],rs[used]
+    keep = np.ones(width, dtype=bool)
+    # first index i with start + 2*i == 0 (mod p), ie. i = -r * inverse(2) (mod p)
+    firsts = ((ps - rs) * ((ps + 1) // 2)) % ps
+    for p,first in zip(ps.tolist(), firsts.tolist()):
+        if start + 2*first == p:    # p itself is in the window
+            first += p
+        keep[first::p] = False
+    return keep
+
+def is_prime_full(candidate):
+    return bool(gmpy2.is_bpsw_prp(candidate))
+
+# yields the is_prime_full results in order, so callers can stop once they have enough
+# processes=None uses os.cpu_count() workers, processes=1 never starts a pool
+def iter_prime_tests(tests, processes=None, pooldigits=POOL_DIGITS):
+    if processes != 1 and len(tests) > 1 and ilen(max(tests)) >= pooldigits:
+        with mp.Pool(processes) as pool:
+            for flag in pool.imap(is_prime_full, tests, chunksize=1):
+                yield flag
+    else:
+        for c in tests:
+            yield is_prime_full(c)
+
+def batch_is_prime(candidates, processes=None, pooldigits=POOL_DIGITS):
+    candidates = [gmpy2.mpz(c) for c in candidates]
+    results = [False] * len(candidates)
+    large = []
+    for i,c in enumerate(candidates):
+        if c < GCD_BOUND:
+            results[i] = bool(gmpy2.is_prime(c))
+        else:
+            large.append(i)
+    keep = wheel_filter([candidates[i] for i in large])
+    prim = gcd_primorial()
+    survivors = [i for i,k in zip(large, keep) if k and gmpy2.gcd(candidates[i], prim) == 1]
+    flags = iter_prime_tests([candidates[i] for i in survivors], processes=processes, pooldigits=pooldigits)
+    for i,flag in zip(survivors, flags):
+        results[i] = flag
+    return results
+
 
 
 
@@ -10,7 +10,15 @@ import sys
 import re
 import struct
 import os.path
-import subprocess
+import time
+import json
+import datetime
+import gzip
+import bz2
+import zlib
+import lzma
+import multiprocessing as mp
+import numpy as np
 
 myname = os.path.basename(sys.argv[0])
 
@@ -25,9 +33,25 @@ def handleInterrupt(SigNum, Frame):
 ############
 def usage():
     sys.stderr.write('\n')
-    sys.stderr.write(' usage: %s <utmp/utmpx/wtmp/wtmpx file>\n' % myname)
+    sys.stderr.write(' usage: %s [query] <utmp/utmpx/wtmp/wtmpx file> [file ...]\n' % myname)
     sys.stderr.write('\n')
-    sys.stderr.write(' NOTE: if .gz found then gunzip -c will be used\n')
+    sys.stderr.write(' query: -u <user>[,user...]   only these users\n')
+    sys.stderr.write('        -l <line>[,line...]   only these ttys, eg. pts/0\n')
+    sys.stderr.write('        -H <host>[,host...]   only these hosts\n')
+    sys.stderr.write('        -t <type>[,type...]   only these record types, eg. USER_PROCESS,BOOT_TIME or 7,2\n')
+    sys.stderr.write('        -s <time>             records from this time\n')
+    sys.stderr.write('        -e <time>             records before this time\n')
+    sys.stderr.write('        -g sessions           list sessions (login to logout) instead of records\n')
+    sys.stderr.write('        -g user|line|host     sessions and total session time for each\n')
+    sys.stderr.write('        -g type               number of records of each type\n')
+    sys.stderr.write('        -f <statefile>        follow the file, printing records as they are added\n')
+    sys.stderr.write('        -o <statefile>        print the records added since the last -f/-o and exit\n')
+    sys.stderr.write('        <time> is epoch seconds, YYYY-MM-DD[THH:MM[:SS]] or an age, eg. 30m 12h 7d 2w\n')
+    sys.stderr.write('\n')
+    sys.stderr.write(' NOTE: .gz, .bz2 and .xz files are decompressed as they are read\n')
+    sys.stderr.write('       give rotated files oldest first, eg. wtmp.2.gz wtmp.1 wtmp\n')
+    sys.stderr.write('       -f/-o keep the position and inode of the file in <statefile>; with no\n')
+    sys.stderr.write('       <statefile> yet they start at the end of the file, like tail -f\n')
     sys.stderr.write('\n')
     sys.exit(2)
 
@@ -43,13 +67,47 @@ def warning(Msg):
 
 
 #####################
+QUERY_OPTIONS = {'-u': 'user', '-l': 'line', '-H': 'host', '-t': 'types', '-s': 'since', '-e': 'until', '-g': 'group',
+                 '-f': 'follow', '-o': 'once'}
+GROUPS = ['sessions', 'user', 'line', 'host', 'type']
+
 def getOptions(argv):
-    if len(argv) < 2:
+    args = argv[1:]
+    query = {}
+    while args and args[0] in QUERY_OPTIONS:
+        if len(args) < 2:
+            usage()
+        query[QUERY_OPTIONS[args[0]]] = args[1]
+        args = args[2:]
+    if len(args) < 1:
         usage()
-    fname = argv[1]
-    if not os.path.exists(fname):
-        error(1, 'file "%s" does not exist' % (fname))
-    return fname
+    now = time.time()
+    try:
+        for key in ['user', 'line', 'host']:
+            if key in query:
+                query[key] = query[key].split(',')
+        if 'types' in query:
+            query['types'] = parse_types(query['types'])
+        for key in ['since', 'until']:
+            if key in query:
+                query[key] = parse_time(query[key], now)
+    except (KeyError, ValueError) as e:
+        error(2, 'bad query: %s' % (e))
+    if query.get('group', 'sessions') not in GROUPS:
+        error(2, 'bad query: -g must be one of %s' % (', '.join(GROUPS)))
+
+    fnames = args
+    for fname in fnames:
+        if not os.path.exists(fname):
+            error(1, 'file "%s" does not exist' % (fname))
+    if 'follow' in query or 'once' in query:
+        if 'follow' in query and 'once' in query:
+            error(2, 'bad query: give -f or -o, not both')
+        if 'group' in query:
+            error(2, 'bad query: -g cannot be used with -f or -o')
+        if len(fnames) != 1 or xtmp_opener(fnames[0]):
+            error(2, 'bad query: -f and -o need one uncompressed file')
+    return fnames, query
 
 
 ######################
@@ -141,39 +199,413 @@ def getOptions(argv):
 #                                     just ut_addr_v6[0] */
 #    char __unused[20];            /* Reserved for future use */
 # };
+
+######################
+# NumPy versions of the two struct formats above. align=True lays the fields out
+# as struct's native alignment does, so the item sizes are 372 and 384 too.
+# Strings are kept as bytes and only decoded when a record is shown.
+UTMPX_SOLARIS_DTYPE = np.dtype([('ut_user','S32'), ('ut_id','S4'), ('ut_line','S32'), ('ut_pid','i4'),
+                                ('ut_type','i2'), ('e_termination','i2'), ('e_exit','i2'),
+                                ('tv_sec','i4'), ('tv_usec','i4'), ('ut_session','i4'), ('pad','i4',(5,)),
+                                ('ut_syslen','i2'), ('ut_host','S257'), ('unused','V1')], align=True)
+
+UTMP_DTYPE = np.dtype([('ut_type','i2'), ('ut_pid','i4'), ('ut_line','S32'), ('ut_id','S4'), ('ut_user','S32'),
+                       ('ut_host','S256'), ('e_termination','i2'), ('e_exit','i2'), ('ut_session','i4'),
+                       ('tv_sec','i4'), ('tv_usec','i4'), ('ut_addr_v6','i4',(4,)), ('unused','V20')], align=True)
+
+XTMP_DTYPES = {'32s4s32sihhhiii5ih257sx': UTMPX_SOLARIS_DTYPE,
+               'hi32s4s32s256shhiii4i20x': UTMP_DTYPE}
+
+# ut_type values, as in utmp.h
+UT_TYPES = {'EMPTY': 0, 'RUN_LVL': 1, 'BOOT_TIME': 2, 'NEW_TIME': 3, 'OLD_TIME': 4, 'INIT_PROCESS': 5,
+            'LOGIN_PROCESS': 6, 'USER_PROCESS': 7, 'DEAD_PROCESS': 8, 'ACCOUNTING': 9}
+UT_TYPE_NAMES = dict((v, k) for k, v in UT_TYPES.items())
+EMPTY = UT_TYPES['EMPTY']
+RUN_LVL = UT_TYPES['RUN_LVL']
+BOOT_TIME = UT_TYPES['BOOT_TIME']
+USER_PROCESS = UT_TYPES['USER_PROCESS']
+DEAD_PROCESS = UT_TYPES['DEAD_PROCESS']
+
+TIME_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 7*86400}
+
+
+############
+# "USER_PROCESS,2" -> [7, 2]
+def parse_types(s):
+    return [int(t) if t.isdigit() else UT_TYPES[t.upper()] for t in s.split(',')]
+
+
+############
+# epoch seconds, an ISO date/time (local time) or an age like 7d
+def parse_time(s, now):
+    m = re.match(r'^(\d+)([smhdw])$', s)
+    if m:
+        return now - int(m.group(1)) * TIME_UNITS[m.group(2)]
+    if s.isdigit():
+        return int(s)
+    return datetime.datetime.fromisoformat(s).timestamp()
+
+
+def fmt_time(secs):
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(secs))
+
+
+def fmt_secs(secs):
+    secs = int(secs)
+    return '%d+%02d:%02d:%02d' % (secs // 86400, secs // 3600 % 24, secs // 60 % 60, secs % 60)
+
+
+############
+# One record as the list of strings it has always been printed as: strings cut at
+# the first NUL and decoded, numbers (and the ints of the array fields) as str
+def record_fields(rec):
+    fields = []
+    for name in rec.dtype.names:
+        value = rec[name]
+        if isinstance(value, bytes):
+            fields.append(value.split(b'\0', 1)[0].decode('utf-8', 'replace'))
+        elif isinstance(value, np.ndarray):
+            fields.extend(str(v) for v in value.tolist())
+        elif not isinstance(value, np.void):
+            fields.append(str(value))
+    return fields
+
+
+############
+# Non-empty records of an xtmp file, newest first like the old list, without
+# copying: rec is the file's records (a memmap for plain files) and sel holds
+# the indexes of the non-empty ones. Records are decoded as they are used.
+class Xtmp:
+    def __init__(self, rec, mask=None):
+        self.rec = rec
+        keep = rec['ut_type'] != EMPTY
+        if mask is not None:
+            keep &= mask
+        self.sel = np.flatnonzero(keep)
+
+    # the records matching a query, see xtmp_mask()
+    def where(self, **query):
+        return Xtmp(self.rec, xtmp_mask(self.rec, **query))
+
+    def __len__(self):
+        return len(self.sel)
+
+    def __getitem__(self, i):
+        return record_fields(self.rec[self.sel[::-1][i]])
+
+    def __iter__(self):
+        for i in self.sel[::-1]:
+            yield record_fields(self.rec[i])
+
+    # oldest first, like the file
+    def __reversed__(self):
+        for i in self.sel:
+            yield record_fields(self.rec[i])
+
+    # the non-empty records as one structured array, oldest first
+    def records(self):
+        return self.rec[self.sel]
+
+
+############
+# Query filters as one boolean mask over the structured records. Only the
+# fields asked about are read and nothing is decoded: the strings are
+# encoded once and compared as bytes (numpy ignores the NUL padding).
+def xtmp_mask(rec, user=None, line=None, host=None, types=None, since=None, until=None, **unused):
+    mask = np.ones(len(rec), dtype=bool)
+    for field, values in [('ut_user', user), ('ut_line', line), ('ut_host', host)]:
+        if values is not None:
+            mask &= np.isin(rec[field], [v.encode() for v in values])
+    if types is not None:
+        mask &= np.isin(rec['ut_type'], types)
+    if since is not None or until is not None:
+        secs = xtmp_secs(rec)
+        if since is not None:
+            mask &= secs >= since
+        if until is not None:
+            mask &= secs < until
+    return mask
+
+
+# idx picks records by field, which avoids copying whole records
+def xtmp_secs(rec, idx=slice(None)):
+    return rec['tv_sec'][idx] + rec['tv_usec'][idx] * 1e-6
+
+
+######################
+# A session runs from a USER_PROCESS record to whichever comes first of: the
+# next record for the same line (a DEAD_PROCESS logout, or another login if the
+# logout was lost), a reboot, or a shutdown. Sessions still open end at now.
+SESSION_DTYPE = np.dtype([('login', 'i8'), ('end', 'i8'), ('how', 'U6'), ('start', 'f8'), ('stop', 'f8'), ('secs', 'f8')])
+
+
+def xtmp_sessions(rec, now=None):
+    utype = rec['ut_type']
+    idx = np.flatnonzero((utype == USER_PROCESS) | (utype == DEAD_PROCESS))
+    # group by line then file position; sorting the lines as 64-bit words
+    # only groups equal lines together, but is much faster than as strings
+    lines = rec['ut_line'][idx]
+    words = np.ascontiguousarray(lines).view(np.uint64).reshape(len(idx), -1)
+    order = np.lexsort((idx,) + tuple(words.T))
+    idx, lines = idx[order], lines[order]
+
+    nxt = np.full(len(idx), -1, dtype=np.int64)
+    same = lines[1:] == lines[:-1]
+    nxt[:-1][same] = idx[1:][same]
+    login = utype[idx] == USER_PROCESS
+    idx, end = idx[login], nxt[login]
+
+    downs = np.flatnonzero((utype == BOOT_TIME) | ((utype == RUN_LVL) & (rec['ut_user'] == b'shutdown')))
+    if len(downs):
+        k = np.searchsorted(downs, idx)
+        down = np.where(k < len(downs), downs[np.minimum(k, len(downs) - 1)], -1)
+        end = np.where((down >= 0) & ((end < 0) | (down < end)), down, end)
+
+    order = np.argsort(idx, kind='stable')
+    idx, end = idx[order], end[order]
+    sessions = np.zeros(len(idx), dtype=SESSION_DTYPE)
+    sessions['login'] = idx
+    sessions['end'] = end
+    sessions['start'] = xtmp_secs(rec, idx)
+    ended = end >= 0
+    sessions['stop'] = time.time() if now is None else now
+    sessions['stop'][ended] = xtmp_secs(rec, end[ended])
+    sessions['secs'] = sessions['stop'] - sessions['start']
+
+    how = np.full(len(idx), 'still', dtype='U6')
+    endtype = utype[end[ended]]
+    how[ended] = np.select([endtype == DEAD_PROCESS, endtype == USER_PROCESS, endtype == BOOT_TIME],
+                           ['logout', 'gone', 'crash'], 'down')
+    sessions['how'] = how
+    return sessions
+
+
+############
+# Sessions matching a query: user/line/host are those of the login, and a
+# session matches since/until if any part of it lies between them
+def query_sessions(rec, since=None, until=None, **query):
+    sessions = xtmp_sessions(rec)
+    mask = xtmp_mask(rec, **query)[sessions['login']]
+    if since is not None:
+        mask &= sessions['stop'] >= since
+    if until is not None:
+        mask &= sessions['start'] < until
+    return sessions[mask]
+
+
+############
+# Group-by: the unique keys, how many of each and the sum of weights for each
+def group_by(keys, weights=None):
+    uniq, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+    sums = np.bincount(inverse, weights=weights, minlength=len(uniq)) if weights is not None else None
+    return uniq, counts, sums
+
+
+def decode(s):
+    return s.split(b'\0', 1)[0].decode('utf-8', 'replace')
+
+
+############
+# -g output
+def print_sessions(rec, sessions):
+    for s in sessions:
+        r = rec[s['login']]
+        stop = fmt_time(s['stop']) if s['how'] != 'still' else 'still logged in'
+        print ('%-12s %-12s %-20s %s - %-19s %-6s %s' % (decode(r['ut_user']), decode(r['ut_line']), decode(r['ut_host']),
+                                                         fmt_time(s['start']), stop, s['how'], fmt_secs(s['secs'])))
+
+
+def print_groups(rec, group, sessions):
+    if group == 'type':
+        uniq, counts, _ = group_by(rec['ut_type'][rec['ut_type'] != EMPTY])
+        for key, count in zip(uniq, counts):
+            print ('%-14s %d' % (UT_TYPE_NAMES.get(int(key), str(key)), count))
+    else:
+        uniq, counts, sums = group_by(rec['ut_' + group][sessions['login']], sessions['secs'])
+        for key, count, secs in zip(uniq, counts, sums):
+            print ('%-20s %6d %s' % (decode(key), count, fmt_secs(secs)))
+
+
+######################
+# Compressed (rotated) files are read in-process. XTMP_CHUNK is the size of the
+# raw reads from disk and, rounded down to whole records, of each decompressed
+# piece passed to np.frombuffer, so records never straddle two pieces.
+XTMP_OPEN = {'.gz': gzip.open, '.bz2': bz2.open, '.xz': lzma.open}
+XTMP_CHUNK = 2**22
+
+
+def xtmp_opener(fname):
+    return XTMP_OPEN.get(os.path.splitext(fname)[1])
+
+
+############
+# Records of a compressed file as a stream of structured arrays, each at most
+# XTMP_CHUNK bytes. A partial record at the end is reported and dropped.
+def xtmp_chunks(fname, dtype, chunk=XTMP_CHUNK):
+    size = max(chunk // dtype.itemsize, 1) * dtype.itemsize
+    with open(fname, 'rb', buffering=chunk) as raw, xtmp_opener(fname)(raw, 'rb') as fp:
+        rest = b''
+        while True:
+            data = fp.read(size - len(rest))
+            if not data:
+                break
+            data = rest + data if rest else data
+            whole = len(data) - len(data) % dtype.itemsize
+            rest = data[whole:]
+            if whole:
+                yield np.frombuffer(data, dtype=dtype, count=whole // dtype.itemsize)
+    if rest:
+        warning('last block read (%d bytes) was not the right size (%d bytes)' % (len(rest), dtype.itemsize))
+
+
+############
+# All the records of one file, oldest first: a memmap for plain files, an
+# array built from xtmp_chunks() for compressed ones
+def read_records(fname, dtype):
+    if xtmp_opener(fname):
+        chunks = list(xtmp_chunks(fname, dtype))
+        return np.concatenate(chunks) if chunks else np.zeros(0, dtype=dtype)
+
+    size = os.path.getsize(fname)
+    nrec = size // dtype.itemsize
+    if size % dtype.itemsize != 0:
+        warning('last block read (%d bytes) was not the right size (%d bytes)' % (size % dtype.itemsize, dtype.itemsize))
+    if nrec == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(fname, dtype=dtype, mode='r', shape=(nrec,))
+
+
 def read_xtmp(fname,xtmpStruct,xtmpStructSize):
-    result = []
+    return Xtmp(read_records(fname, XTMP_DTYPES[xtmpStruct]))
+
+
+############
+# Several files, eg. wtmp.2.gz wtmp.1.gz wtmp, as one Xtmp (oldest first in the
+# order given). Compressed files are decompressed in parallel, processes=None
+# uses os.cpu_count() workers, processes=1 never starts a pool.
+def read_xtmps(fnames,xtmpStruct,xtmpStructSize,processes=None):
+    if len(fnames) == 1:
+        return read_xtmp(fnames[0], xtmpStruct, xtmpStructSize)
+
+    dtype = XTMP_DTYPES[xtmpStruct]
+    packed = [fname for fname in fnames if xtmp_opener(fname)]
+    processes = min(processes or mp.cpu_count(), len(packed))
+    if processes > 1:
+        with mp.Pool(processes) as pool:
+            results = dict(zip(packed, pool.starmap(read_records, [(fname, dtype) for fname in packed])))
+    else:
+        results = {fname: read_records(fname, dtype) for fname in packed}
 
-    cmd = "gunzip -c %s" % (fname)
-    if re.match(r'.*gz$', fname):
-        fp = os.popen(cmd,'rb')
+    recs = [results[fname] if fname in results else read_records(fname, dtype) for fname in fnames]
+    return Xtmp(np.concatenate(recs))
+
+
+
+######################
+# Follow mode. The state file records the file's device, inode and the offset
+# after the last whole record read, so each poll costs an fstat and a stat
+# plus reading whatever was appended. A new inode at the path means the file
+# was rotated: the rest of the old file is read from the open descriptor and
+# then the new file from the start. A file shorter than the offset, or whose
+# record before the offset no longer matches the saved checksum, was truncated
+# (and perhaps written again) and is read again from the start.
+FOLLOW_SECS = 2
+
+
+def load_state(statefile):
+    try:
+        with open(statefile) as fp:
+            return json.load(fp)
+    except FileNotFoundError:
+        return None
+    except ValueError:
+        warning('state file "%s" is corrupt, starting at the end of the file' % (statefile))
+        return None
+
+
+# written to a temporary file and renamed so it is never seen half-written
+def save_state(statefile, state):
+    tmp = statefile + '.tmp'
+    with open(tmp, 'w') as fp:
+        json.dump(state, fp)
+    os.replace(tmp, statefile)
+
+
+def file_id(st):
+    return [st.st_dev, st.st_ino]
+
+
+# checksum of the record before offset, None at the start of the file
+def last_crc(fd, dtype, offset):
+    if offset < dtype.itemsize:
+        return None
+    return zlib.crc32(os.pread(fd, dtype.itemsize, offset - dtype.itemsize))
+
+
+def path_id(fname):
+    try:
+        return file_id(os.stat(fname))
+    except FileNotFoundError:
+        return None    # between the rename and create of a rotation
+
+
+############
+# New records as a stream of structured arrays, oldest first, at most
+# XTMP_CHUNK bytes each. The state is saved after each one has been used, so
+# a record can be repeated after a crash but is never missed.
+def follow_xtmp(fname, dtype, statefile, once=False, secs=FOLLOW_SECS, chunk=XTMP_CHUNK):
+    maxrec = max(chunk // dtype.itemsize, 1)
+    fp = open(fname, 'rb')
+    st = os.fstat(fp.fileno())
+    state = load_state(statefile)
+    if state is None:
+        offset = st.st_size - st.st_size % dtype.itemsize
+        crc = last_crc(fp.fileno(), dtype, offset)
+    elif state['id'] != file_id(st):
+        warning('"%s" has been rotated since the state was saved, reading it from the start' % (fname))
+        offset, crc = 0, None
     else:
-        fp = open(fname, 'rb')
+        offset, crc = state['offset'], state['crc']
+    saved = None
 
     while True:
-        bytes = fp.read(xtmpStructSize)
-        if not bytes:
-            break
+        current = file_id(os.fstat(fp.fileno()))
+        rotated = path_id(fname) not in [None, current]
+        size = os.fstat(fp.fileno()).st_size
+        if size < offset or last_crc(fp.fileno(), dtype, offset) != crc:
+            warning('"%s" has been truncated, reading it from the start' % (fname))
+            offset, crc = 0, None
 
-        if (len(bytes) == xtmpStructSize):
-            data = struct.unpack(xtmpStruct, bytes)
-            data = [(lambda s: str(s).split("\0", 1)[0])(i) for i in data]
-            if data[0] != '0':
-                result.append(data)
-        else:
-            warning('block read (%d bytes) was not the right size (%d bytes)' % (len(bytes), xtmpStructSize))
+        nrec = min((size - offset) // dtype.itemsize, maxrec)
+        if nrec > 0:
+            data = os.pread(fp.fileno(), nrec * dtype.itemsize, offset)
+            nrec = len(data) // dtype.itemsize
+            offset += nrec * dtype.itemsize
+            crc = zlib.crc32(data[-dtype.itemsize:])
+            yield np.frombuffer(data, dtype=dtype, count=nrec)
 
-    fp.close()
-    result.reverse()
+        if saved != (current, offset, crc):
+            save_state(statefile, {'file': os.path.abspath(fname), 'id': current, 'offset': offset, 'crc': crc})
+            saved = (current, offset, crc)
 
-    return result
+        if nrec == maxrec:
+            continue
+        if rotated:
+            fp.close()
+            fp = open(fname, 'rb')
+            offset, crc = 0, None
+            continue
+        if once:
+            break
+        time.sleep(secs)
+    fp.close()
 
 
 
 ################
-def main(fname):
+def main(fnames, query):
     signal.signal(signal.SIGINT, handleInterrupt)
-    if re.match(r'.*[uw]tmpx.*', fname):
+    if re.match(r'.*[uw]tmpx.*', fnames[0]):
 	    print ('Found utmpx/wtmpx in filename so assuming utmpx/wtmpx structure')
 	    xtmpStruct = '32s4s32sihhhiii5ih257sx'
 	    xtmpStructSize = struct.calcsize(xtmpStruct)
@@ -182,15 +614,35 @@ def main(fname):
 	    xtmpStruct = 'hi32s4s32s256shhiii4i20x'
 	    xtmpStructSize = struct.calcsize(xtmpStruct)
 
-    data = read_xtmp(fname, xtmpStruct, xtmpStructSize)
-    for block in data:
-        print (block)
+    once = 'once' in query
+    statefile = query.pop('once' if once else 'follow', None)
+    if statefile:
+        for rec in follow_xtmp(fnames[0], XTMP_DTYPES[xtmpStruct], statefile, once=once):
+            for block in reversed(Xtmp(rec, xtmp_mask(rec, **query))):
+                print (block)
+            sys.stdout.flush()
+        return
+
+    data = read_xtmps(fnames, xtmpStruct, xtmpStructSize)
+    group = query.pop('group', None)
+    if group == 'type':
+        print_groups(data.rec[xtmp_mask(data.rec, **query)], group, None)
+    elif group is not None:
+        sessions = query_sessions(data.rec, **query)
+        if group == 'sessions':
+            print_sessions(data.rec, sessions)
+        else:
+            print_groups(data.rec, group, sessions)
+    else:
+        if query:
+            data = data.where(**query)
+        for block in data:
+            print (block)
 
 
 #########################
 if __name__ == "__main__":
-    fname = getOptions(sys.argv)
-    main(fname)
-
-sys.exit(0)
+    fnames, query = getOptions(sys.argv)
+    main(fnames, query)
+    sys.exit(0)
 
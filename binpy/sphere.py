@@ -11,6 +11,10 @@ import os
 import sys
 import math
 import re
+import functools
+import collections
+import numpy as np
+import multiprocessing as mp
  
 def usage(name):
     print ("")
@@ -25,6 +29,19 @@ def usage(name):
     print (" The \"mcsolid\" and \"mchollow\" options are used by \"mcwrite.sh\" to draw a")
     print (" sphere in Minecraft (Bedrock).")
     print ("")
+    print (" usage: %s <radius> runssolid|runshollow"%(name))
+    print (" usage: %s <radius> binsolid|binhollow"%(name))
+    print ("")
+    print (" Compact forms of the mc output: one \"y z x_start x_end\" line per x run,")
+    print (" or the same runs as binary int32 records after an 8 byte header.")
+    print ("")
+    print (" usage: %s ellipsoid <a> <b> <c> <mode> [processes]"%(name))
+    print (" usage: %s cylinder <radius> <half height> <mode> [processes]"%(name))
+    print (" usage: %s torus <radius> <tube radius> <mode> [processes]"%(name))
+    print ("")
+    print (" Other shapes take the same modes (solid, hollow, mcsolid, mchollow) and are")
+    print (" drawn z slice by z slice, in parallel over [processes] if given.")
+    print ("")
     sys.exit(2)
  
 '''
@@ -100,66 +117,457 @@ class VLM:
             else:
                 print (line)
 
+'''
+ NPVLM - VLM variant backed by a NumPy char array, for single character cells.
+ The array grows by doubling in the direction of an out-of-range write, so the
+ origin offset (ox,oy) moves as it grows.  mset/msetd also take coordinate
+ arrays, and printm('join') renders the whole grid as one string.
+   m = NPVLM(defval=' ')
+
+   m.mset(np.array([(0,0), (1,1), (-2,-2)]), '#')
+   m.msetd((coords, vals), mapval={0:'O',1:'#'})
+
+   m.printm('join', revy=True)
+'''
+class NPVLM:
+    def __init__(self, minx=0, miny=0, maxx=0, maxy=0, defval=' '):
+        self.__defval = defval.encode()
+        self.__minx = minx
+        self.__miny = miny
+        self.__maxx = maxx
+        self.__maxy = maxy
+        self.__ox = -minx
+        self.__oy = -miny
+        self.__m = np.full((maxy-miny+1, maxx-minx+1), self.__defval, dtype='S1')
+    def __grow(self, lox, loy, hix, hiy):
+        h,w = self.__m.shape
+        cx0, cy0 = -self.__ox, -self.__oy
+        cx1, cy1 = cx0+w-1, cy0+h-1
+        if lox >= cx0 and loy >= cy0 and hix <= cx1 and hiy <= cy1:
+            return
+        nx0 = min(lox, cx0-w) if lox < cx0 else cx0
+        ny0 = min(loy, cy0-h) if loy < cy0 else cy0
+        nx1 = max(hix, cx1+w) if hix > cx1 else cx1
+        ny1 = max(hiy, cy1+h) if hiy > cy1 else cy1
+        m = np.full((ny1-ny0+1, nx1-nx0+1), self.__defval, dtype='S1')
+        m[cy0-ny0:cy0-ny0+h, cx0-nx0:cx0-nx0+w] = self.__m
+        self.__m = m
+        self.__ox, self.__oy = -nx0, -ny0
+    def __setminmax(self, lox, loy, hix, hiy):
+        if lox < self.__minx: self.__minx = lox
+        if loy < self.__miny: self.__miny = loy
+        if hix > self.__maxx: self.__maxx = hix
+        if hiy > self.__maxy: self.__maxy = hiy
+        self.__grow(lox, loy, hix, hiy)
+    def __setitem__(self, pos, val):
+        x,y = pos
+        self.__setminmax(x, y, x, y)
+        self.__m[y+self.__oy, x+self.__ox] = val
+    def __getitem__(self, pos):
+        x,y = pos
+        self.__setminmax(x, y, x, y)
+        return self.__m[y+self.__oy, x+self.__ox].decode()
+    def mset(self, a, val):
+        a = np.asarray(a, dtype=np.int64).reshape(-1, 2)
+        if len(a) == 0:
+            return
+        (lox,loy),(hix,hiy) = a.min(axis=0), a.max(axis=0)
+        self.__setminmax(int(lox), int(loy), int(hix), int(hiy))
+        self.__m[a[:,1]+self.__oy, a[:,0]+self.__ox] = val
+    # d is a dict {(x,y):val} or a (coords, vals) pair of arrays
+    def msetd(self, d, mapval={}):
+        if isinstance(d, dict):
+            coords, vals = list(d.keys()), list(d.values())
+        else:
+            coords, vals = d
+        vals = np.asarray(vals)
+        if len(mapval) > 0:
+            mapped = np.empty(len(vals), dtype='S1')
+            for k,v in mapval.items():
+                mapped[vals == k] = v
+            vals = mapped
+        coords = np.asarray(coords, dtype=np.int64).reshape(-1, 2)
+        for v in np.unique(vals):
+            self.mset(coords[vals == v], v)
+    def renderm(self, revy=False, revx=False):
+        m = self.__m[self.__miny+self.__oy:self.__maxy+self.__oy+1, self.__minx+self.__ox:self.__maxx+self.__ox+1]
+        if revy == True: m = m[::-1]
+        if revx == True: m = m[:,::-1]
+        nl = np.full((m.shape[0], 1), b'\n', dtype='S1')
+        return np.hstack((m, nl)).tobytes().decode()
+    def printm(self, j="", revy=False, revx=False, out=None):
+        out = out or sys.stdout
+        if j == "join":
+            out.write(self.renderm(revy, revx))
+        else:
+            for line in self.renderm(revy, revx).splitlines():
+                out.write("%s\n" % (list(line)))
+
 def print_cmap(cmap):
-    m = VLM(defval=' ')
+    m = NPVLM(defval=' ')
     m.msetd(cmap, mapval={0:' ',1:'#'})
     m.printm('join', revy=True)
 def print_coords(c):
-    m = VLM(defval=' ')
+    m = NPVLM(defval=' ')
     m.mset(c, '#')
     m.printm('join', revy=True)
 
-def title(s):
+def title(s, out=None):
+    out = out or sys.stdout
     ul = '-'*len(s)
-    print (ul); print (s); print (ul)
+    out.write("%s\n%s\n%s\n" % (ul, s, ul))
 
 '''
  The general equation for a sphere is:
  r^2 = x^2 + y^2 + z^2   x,y,z are points on the surface of the sphere with centre (0,0,0)
  The code below fills in the coordinates of a solid sphere.
  It can be hollowed out later by removing those pixels who are surrounded by 6 neighbouring pixels.
+
+ Each voxel k is tested at its centre k+0.5 and int() truncates towards zero,
+ so voxel k sits at distance |k|+0.5 from the centre on each axis (0 is -0.5
+ and 0.5). Doubling everything keeps the test in integers:
+   (2|x|+1)^2 + (2|y|+1)^2 + (2|z|+1)^2 <= 4r^2
+ which is symmetric, so the sphere spans -n..n with n = the largest k where
+ (2k+1)^2 <= 4r^2.
 '''
-def get_sphere(r):
+def sphere_extent(r):
+    lim = 4*r*r
+    n = -1
+    while (2*n+3)**2 <= lim:
+        n += 1
+    return n
+
+# integer sqrt of a non-negative int64 array (float sqrt, then corrected by one)
+def np_isqrt(a):
+    s = np.sqrt(a).astype(np.int64)
+    s -= (s*s > a)
+    s += ((s+1)*(s+1) <= a)
+    return s
+
+# half-width in z of each (x,y) column: span[x+n,y+n] = h means -h..h is inside, -1 means empty
+def sphere_spans(r):
+    n = sphere_extent(r)
+    k = np.arange(-n, n+1, dtype=np.int64)
+    h = (2*np.abs(k)+1)**2
+    rem = 4*r*r - h[:,None] - h[None,:]
+    rem = np.maximum(rem, 0).astype(np.int64)
+    span = (np_isqrt(rem)-1)//2
+    return span, n
+
+# boolean volume vol[x+n,y+n,z+n], built from the spans in one broadcast compare
+def sphere_volume(r):
+    span, n = sphere_spans(r)
+    k = np.abs(np.arange(-n, n+1, dtype=np.int64))
+    return k[None,None,:] <= span[:,:,None], n
+
+# (N,3) array of x,y,z in x, then y, then z order
+def sphere_coords(r):
+    vol, n = sphere_volume(r)
+    return volume_to_coords(vol, n)
+
+def volume_to_coords(vol, n):
+    return np.argwhere(vol) - n
+
+# dict adapter {(x,y,z):1, ...}; the origin is seeded first as the original loop did
+def coords_to_cmap(coords):
     cmap = {(0,0,0):0}
-    for x in range(int(math.floor(-r)),int(math.ceil(r)+1)):
-        x += 0.5
-        for y in range(int(math.floor(-r)),int(math.ceil(r)+1)):
-            y += 0.5
-            for z in range(int(math.floor(-r)),int(math.ceil(r)+1)):
-                z += 0.5
-                if x*x + y*y + z*z <= r*r:
-                    cmap[int(x),int(y),int(z)] = 1
+    cmap.update(((x,y,z),1) for x,y,z in coords.tolist())
     return cmap
 
+def get_sphere(r):
+    return coords_to_cmap(sphere_coords(r))
+
+# a voxel stays in the shell if any of its 6 neighbours is missing (erosion by array shifts)
+def hollow_volume(vol):
+    p = np.pad(vol, 1)
+    eroded = vol & p[:-2,1:-1,1:-1] & p[2:,1:-1,1:-1]
+    eroded &= p[1:-1,:-2,1:-1] & p[1:-1,2:,1:-1]
+    eroded &= p[1:-1,1:-1,:-2] & p[1:-1,1:-1,2:]
+    return vol & ~eroded
+
+# the same thing analytically from the column spans: the shell of column (x,y) is
+# inner < |z| <= span, inner being the smallest of span-1 and the 4 neighbouring spans
+def shell_spans(span):
+    p = np.pad(span, 1, constant_values=-1)
+    inner = np.minimum.reduce([span-1, p[:-2,1:-1], p[2:,1:-1], p[1:-1,:-2], p[1:-1,2:]])
+    return np.minimum(inner, span)
+
+def sphere_shell(r):
+    span, n = sphere_spans(r)
+    inner = shell_spans(span)
+    k = np.abs(np.arange(-n, n+1, dtype=np.int64))
+    return (k[None,None,:] <= span[:,:,None]) & (k[None,None,:] > inner[:,:,None]), n
+
+# dict adapter, keeps the order of cmap
 def hollow_sphere(cmap):
-    for x,y,z in cmap:
-        if (x-1,y,z) in cmap and (x+1,y,z) in cmap and (x,y-1,z) in cmap and (x,y+1,z) in cmap and (x,y,z-1) in cmap and (x,y,z+1) in cmap:
-            cmap[x,y,z] = 0
-    return dict([(k,v) for k,v in cmap.items() if v==1]) 
+    if len(cmap) == 0:
+        return {}
+    keys = list(cmap)
+    coords = np.array(keys, dtype=np.int64)
+    lo = coords.min(axis=0)
+    idx = tuple((coords - lo).T)
+    vol = np.zeros(tuple(coords.max(axis=0) - lo + 1), dtype=bool)
+    vol[idx] = True
+    shell = hollow_volume(vol)[idx] & np.array([v == 1 for v in cmap.values()])
+    return dict((k,1) for k,keep in zip(keys, shell.tolist()) if keep)
+
+# Slice-by-slice producer: yields (k, coords) for each k along axis (0=x, 1=y, 2=z),
+# coords being an (N,2) array of the other two axes in ascending order. Only the
+# O(r^2) column spans are held, so memory is one slice whatever the radius.
+def sphere_slices(r, hollow=False, axis=2):
+    return mask_slices(sphere_masks(r, hollow, axis))
+
+# the same slices as (k, mask, lo): a boolean mask of the other two axes offset by lo
+def sphere_masks(r, hollow=False, axis=2):
+    span, n = sphere_spans(r)
+    inner = shell_spans(span) if hollow else np.full_like(span, -1)
+    k = np.arange(-n, n+1, dtype=np.int64)
+    ak = np.abs(k)
+    for i in range(2*n+1):
+        if axis == 2:
+            mask = (span >= ak[i]) & (inner < ak[i])
+        else:
+            s = span[i] if axis == 0 else span[:,i]
+            t = inner[i] if axis == 0 else inner[:,i]
+            mask = (ak[None,:] <= s[:,None]) & (ak[None,:] > t[:,None])
+        yield int(k[i]), mask, (-n,-n)
+
+def mask_slices(masks):
+    for k,mask,lo in masks:
+        coords = np.argwhere(mask) + lo
+        if len(coords) > 0:
+            yield k, coords
+
+# the dict version always put the origin first, so the streamed output does too
+def has_origin(r, hollow=False):
+    span, n = sphere_spans(r)
+    if n < 0:
+        return False
+    return not hollow or shell_spans(span)[n,n] < 0
+
+# (x,y,z) rows of slice k along x, origin removed when it was already written
+def xslice_rows(x, yz, origin):
+    rows = np.column_stack((np.full(len(yz), x, dtype=np.int64), yz))
+    if origin and x == 0:
+        rows = rows[(yz != 0).any(axis=1)]
+    return rows
+
+def origin_first(xy):
+    return np.concatenate((xy[(xy == 0).all(axis=1)], xy[(xy != 0).any(axis=1)]))
+
+# ascii circle for a slice of (x,y), rendered in one write
+def slice_text(xy):
+    m = NPVLM(defval=' ')
+    m.mset(xy, '#')
+    return m.renderm(revy=True)
+
+'''
+ General shapes.  A Shape is a bounding box lo..hi (inclusive x,y,z) plus either
+ an implicit function inside(x,y,z) -> bool array, called with broadcastable
+ integer voxel coordinates, or a span function spans(x,y) -> (zlo,zhi) giving
+ the inclusive z range of each column (zlo > zhi for an empty column).
+ Voxels use the same centres as get_sphere, |k|+0.5 along each axis, so
+ ellipsoid(r,r,r) is the same set as get_sphere(r).
+
+ The rasteriser works through the box in z-chunks of fixed size, hollowing
+ with a one slice halo either side, and can farm the chunks out to processes.
+ The functions must be module level (or partials of them) to pickle.
+'''
+class Shape:
+    def __init__(self, lo, hi, inside=None, spans=None):
+        self.lo = np.array(lo, dtype=np.int64)
+        self.hi = np.array(hi, dtype=np.int64)
+        self.inside = inside
+        self.spans = spans
+    # boolean volume [x,y,z] of the whole xy box for z0 <= z < z1
+    def chunk(self, z0, z1):
+        x = np.arange(self.lo[0], self.hi[0]+1, dtype=np.int64)
+        y = np.arange(self.lo[1], self.hi[1]+1, dtype=np.int64)
+        z = np.arange(z0, z1, dtype=np.int64)
+        if self.spans is not None:
+            zlo, zhi = self.spans(x[:,None], y[None,:])
+            return (z[None,None,:] >= zlo[:,:,None]) & (z[None,None,:] <= zhi[:,:,None])
+        return np.broadcast_to(self.inside(x[:,None,None], y[None,:,None], z[None,None,:]), (len(x), len(y), len(z)))
+
+# twice the distance of voxel centres from the origin along an axis
+def centre2(k):
+    return 2*np.abs(k)+1
+
+def ellipsoid_inside(a, b, c, x, y, z):
+    a, b, c = float(a), float(b), float(c)
+    return (centre2(x)*b*c)**2 + (centre2(y)*a*c)**2 + (centre2(z)*a*b)**2 <= (2*a*b*c)**2
+
+# circular cylinder of radius r along z, half height h measured like the radius
+def cylinder_spans(r, h, x, y):
+    disc = centre2(x)**2 + centre2(y)**2 <= 4*r*r
+    zhi = np.where(disc, math.floor(h-0.5), -1)
+    return np.where(disc, -zhi, 0), zhi
+
+# torus around z, R from the centre to the middle of the tube, r the tube radius
+def torus_inside(R, r, x, y, z):
+    rho = np.sqrt(centre2(x)**2 + centre2(y)**2) / 2.0
+    return (rho-R)**2 + (centre2(z)/2.0)**2 <= r*r
+
+def ellipsoid(a, b, c):
+    ex = [int(math.ceil(d)) for d in (a, b, c)]
+    return Shape([-e for e in ex], ex, inside=functools.partial(ellipsoid_inside, a, b, c))
+
+def cylinder(r, h):
+    e = int(math.ceil(r))
+    ez = int(math.ceil(h))
+    return Shape((-e,-e,-ez), (e,e,ez), spans=functools.partial(cylinder_spans, r, h))
+
+def torus(R, r):
+    e = int(math.ceil(R+r))
+    ez = int(math.ceil(r))
+    return Shape((-e,-e,-ez), (e,e,ez), inside=functools.partial(torus_inside, R, r))
+
+SHAPES = {'ellipsoid':(ellipsoid, 3), 'cylinder':(cylinder, 2), 'torus':(torus, 2)}
+
+# one z-chunk, hollowed against its neighbouring slices when asked
+def shape_chunk(args):
+    shape, z0, z1, hollow = args
+    if not hollow:
+        return z0, shape.chunk(z0, z1)
+    vol = hollow_volume(shape.chunk(z0-1, z1+1))
+    return z0, vol[:,:,1:-1]
+
+# yields (z0, vol) in z order; with processes > 1 no more than 2*processes chunks are in flight
+def shape_chunks(shape, hollow=False, chunk=32, processes=1):
+    tasks = [(shape, z0, min(z0+chunk, int(shape.hi[2])+1), hollow) for z0 in range(int(shape.lo[2]), int(shape.hi[2])+1, chunk)]
+    if processes == 1:
+        for t in tasks:
+            yield shape_chunk(t)
+        return
+    processes = processes or mp.cpu_count()
+    pool = mp.Pool(processes)
+    try:
+        window = collections.deque()
+        for t in tasks:
+            window.append(pool.apply_async(shape_chunk, (t,)))
+            if len(window) >= 2*processes:
+                yield window.popleft().get()
+        while window:
+            yield window.popleft().get()
+    finally:
+        pool.terminate()
+
+# (z, xy) for each non-empty z slice, xy in x then y order as sphere_slices gives them
+def shape_slices(shape, hollow=False, chunk=32, processes=1):
+    return mask_slices(shape_masks(shape, hollow, chunk, processes))
+
+def shape_masks(shape, hollow=False, chunk=32, processes=1):
+    lo = tuple(shape.lo[:2].tolist())
+    for z0,vol in shape_chunks(shape, hollow, chunk, processes):
+        for i in range(vol.shape[2]):
+            yield z0+i, vol[:,:,i], lo
+
+# shared output for any (z, xy) slice source
+def write_zslices(slices, out):
+    for z,xy in slices:
+        out.write("%d [%s]\n" % (z, ", ".join(["(%d, %d)"]*len(xy)) % tuple(xy.ravel().tolist())))
+
+def write_circles(slices, out):
+    for z,xy in slices:
+        out.write("SLICE: %d\n" % (z))
+        out.write(slice_text(xy))
+
+def print_shape(shape, hollow=False, out=None, processes=1):
+    out = out or sys.stdout
+    title ("coords {(x,y,z):1, ...}", out)
+    sep = ""
+    out.write("{")
+    for z,xy in shape_slices(shape, hollow, processes=processes):
+        out.write(sep + ", ".join(["(%d, %d, %d): 1"]*len(xy)) % tuple(np.column_stack((xy, np.full(len(xy), z))).ravel().tolist()))
+        sep = ", "
+    out.write("}\n")
+    title ("coords: z slice and [(x,y), ...]", out)
+    write_zslices(shape_slices(shape, hollow, processes=processes), out)
+    title ("circle slices by z", out)
+    write_circles(shape_slices(shape, hollow, processes=processes), out)
+
+def mcprint_shape(shape, hollow=False, out=None, processes=1):
+    out = out or sys.stdout
+    for z,xy in shape_slices(shape, hollow, processes=processes):
+        line = "%%d %%d %d\n" % (z)
+        out.write(line*len(xy) % tuple(xy.ravel().tolist()))
 
 # 1. print sphere map
 # 2. print slices and coordinates
 # 3. print slices as ascii circles
-def print_slices(cmap):
-    title ("coords {(x,y,z):1, ...}")
-    print (cmap)
-    slices = {}
-    for x,y,z in cmap:
-        if z not in slices:
-            slices[z] = []
-        slices[z] += [(x,y)]
-    title ("coords: z slice and [(x,y), ...]")
-    for z in sorted(list(slices.keys())):
-        print (z, slices[z])
-    title ("circle slices by z")
-    for z in sorted(list(slices.keys())):
-        print("SLICE:",z)
-        print_coords(slices[z])
-
-# print x,y,z for Minecraft script mcwrite.sh
-def mcprint_slices(cmap):
-    for x,y,z in cmap:
-        print (x,y,z)
+def print_slices(r, hollow=False, out=None):
+    out = out or sys.stdout
+    title ("coords {(x,y,z):1, ...}", out)
+    origin = has_origin(r, hollow)
+    sep = ""
+    out.write("{")
+    if origin:
+        out.write("(0, 0, 0): 1")
+        sep = ", "
+    for x,yz in sphere_slices(r, hollow, axis=0):
+        rows = xslice_rows(x, yz, origin)
+        if len(rows) > 0:
+            out.write(sep + ", ".join(["(%d, %d, %d): 1"]*len(rows)) % tuple(rows.ravel().tolist()))
+            sep = ", "
+    out.write("}\n")
+    title ("coords: z slice and [(x,y), ...]", out)
+    write_zslices(((z, origin_first(xy) if origin and z == 0 else xy) for z,xy in sphere_slices(r, hollow)), out)
+    title ("circle slices by z", out)
+    write_circles(sphere_slices(r, hollow), out)
+
+# print x,y,z for Minecraft script mcwrite.sh, one bulk write per slice
+def mcprint_slices(r, hollow=False, out=None):
+    out = out or sys.stdout
+    origin = has_origin(r, hollow)
+    if origin:
+        out.write("0 0 0\n")
+    for x,yz in sphere_slices(r, hollow, axis=0):
+        rows = xslice_rows(x, yz, origin)
+        out.write("%d %d %d\n"*len(rows) % tuple(rows.ravel().tolist()))
+
+'''
+ Compact output.  Every (y,z) row of a slice is a few contiguous x runs, so
+ writing runs "y z x_start x_end" instead of voxels is O(r^2) lines.  The binary
+ form is RUNS_MAGIC followed by little-endian int32 records (y, z, x_start, x_end).
+'''
+RUNS_MAGIC = b'VOXRUNS1'
+RUNS_DTYPE = np.dtype('<i4')
+
+# (N,4) arrays of y, z, x_start, x_end, one per z slice mask[x,y], ordered by y then x
+def slice_runs(masks):
+    for z,mask,(xlo,ylo) in masks:
+        m = np.pad(mask.T, ((0,0),(1,1))).view(np.int8)
+        d = np.diff(m, axis=1)
+        starts = np.argwhere(d == 1)
+        ends = np.flatnonzero(d.ravel() == -1) % d.shape[1]
+        if len(starts) > 0:
+            yield np.column_stack((starts[:,0]+ylo, np.full(len(starts), z, dtype=np.int64), starts[:,1]+xlo, ends-1+xlo))
+
+def mcprint_runs(masks, out=None):
+    out = out or sys.stdout
+    for runs in slice_runs(masks):
+        out.write("%d %d %d %d\n"*len(runs) % tuple(runs.ravel().tolist()))
+
+def mcwrite_binary_runs(masks, out=None):
+    out = out or sys.stdout.buffer
+    out.write(RUNS_MAGIC)
+    for runs in slice_runs(masks):
+        out.write(runs.astype(RUNS_DTYPE).tobytes())
+
+# read the binary runs back as an (N,4) array
+def read_binary_runs(path):
+    with open(path, 'rb') as fd:
+        if fd.read(len(RUNS_MAGIC)) != RUNS_MAGIC:
+            raise ValueError("%s: not a runs file" % (path))
+        return np.frombuffer(fd.read(), dtype=RUNS_DTYPE).reshape(-1, 4)
+
+# write slices in the form the mode asks for: mc* voxels, runs* text runs, bin* binary runs
+def write_mode(mode, masks):
+    if re.match(r'^runs',mode):
+        mcprint_runs(masks)
+    else:
+        sys.stdout.flush()
+        mcwrite_binary_runs(masks)
 
 '''
  main
@@ -169,15 +577,29 @@ if __name__ == '__main__':
     __myname__ = os.path.basename(sys.argv[0])
     arg2 = ""
     if len(sys.argv) == 3: arg2 = sys.argv[2]
-    if len(sys.argv) >= 2:
+    if len(sys.argv) >= 2 and sys.argv[1] in SHAPES:
+        mkshape,nargs = SHAPES[sys.argv[1]]
+        if len(sys.argv) < nargs+3:
+            usage(__myname__)
+        dims = [float(d) if '.' in d else int(d) for d in sys.argv[2:nargs+2]]
+        arg2 = sys.argv[nargs+2]
+        processes = int(sys.argv[nargs+3]) if len(sys.argv) > nargs+3 else 1
+        hollow = re.match(r'.*hollow$',arg2) is not None
+        if re.match(r'^(runs|bin)',arg2):
+            write_mode(arg2, shape_masks(mkshape(*dims), hollow, processes=processes))
+        elif re.match(r'^mc',arg2):
+            mcprint_shape(mkshape(*dims), hollow, processes=processes)
+        else:
+            print_shape(mkshape(*dims), hollow, processes=processes)
+    elif len(sys.argv) >= 2:
         radius = int(sys.argv[1])
-        cmap = get_sphere(radius)
-        if re.match(r'.*hollow$',arg2):
-            cmap = hollow_sphere(cmap)
-        if re.match(r'^mc',arg2):
-            mcprint_slices(cmap)
+        hollow = re.match(r'.*hollow$',arg2) is not None
+        if re.match(r'^(runs|bin)',arg2):
+            write_mode(arg2, sphere_masks(radius, hollow))
+        elif re.match(r'^mc',arg2):
+            mcprint_slices(radius, hollow)
         else:
-            print_slices(cmap)
+            print_slices(radius, hollow)
     else:
         usage(__myname__)
 
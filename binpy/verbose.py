@@ -13,6 +13,14 @@ import sys
 import os
 import time
 import datetime
+import atexit
+import random
+import threading
+import multiprocessing as mp
+try:
+    import queue
+except ImportError:
+    import Queue as queue
 
 __author__  = "Colin Pearse <colin@thepearses.com>"
 __status__  = "beta"
@@ -23,6 +31,32 @@ vlevels = [1]
 vpathname = None
 vfh = sys.stderr
 
+# vlevels precompiled by setLevels, and requested levels already parsed by isLevel
+vmaxlevel = 1
+vstrlevels = frozenset()
+vparsed = {}
+
+# background writer, see startAsync
+vqueue = None
+vthread = None
+vpolicy = "block"
+vdropped = 0
+vwriteerrors = 0
+vbatch = 256
+
+# multiprocess channel, see startChannel
+vchannel = None
+vchannelpid = None
+vchthread = None
+vworker = None
+
+# timers and counters, see Timer
+vtimers = {}
+vcounters = {}
+vtimersamples = 4096
+vtimerlast = time.time()
+vclock = getattr(time, "perf_counter", time.time)
+
 
 def splitLevelsList(levels):
     strlevels = [l for l in levels if type(l) is str]
@@ -81,8 +115,12 @@ def splitLevels(levels,separator=','):
 # levels can be a list or str - see splitLevels
 def setLevels(levels,separator=','):
     global vlevels
+    global vmaxlevel
+    global vstrlevels
     ivlevels,svlevels = splitLevels(levels)
     vlevels = [ivlevels] + svlevels
+    vmaxlevel = ivlevels
+    vstrlevels = frozenset(svlevels)
 
 # if I've already opened a file, close it before setting a new fh
 def setStream(fh):
@@ -105,6 +143,7 @@ def openFile(filename,mode="a"):
 def closeFile():
     global vpathname
     global vfh
+    flushAsync()
     if vpathname is not None:
         try:
             vfh.close()
@@ -112,6 +151,225 @@ def closeFile():
         except:
             sys.exit("cannot close %s" % (vpathname))
 
+# Queue messages for a background thread instead of writing them in-line.
+# policy "block" waits when maxsize messages are queued, "drop" discards the
+# message and counts it in vdropped. Each message keeps the stream it was
+# meant for, so setStream/openFile only affect later messages.
+def startAsync(maxsize=10000,policy="block"):
+    global vqueue
+    global vthread
+    global vpolicy
+    stopAsync()
+    vpolicy = policy
+    vqueue = queue.Queue(maxsize)
+    vthread = threading.Thread(target=asyncWriter,args=(vqueue,),name="verbose")
+    vthread.daemon = True
+    vthread.start()
+
+# write out what is queued and go back to writing in-line
+def stopAsync():
+    global vqueue
+    global vthread
+    if vqueue is not None:
+        if vthread.is_alive():
+            vqueue.put(None)
+            vthread.join()
+        vqueue = None
+        vthread = None
+
+atexit.register(stopAsync)
+
+# wait until everything queued so far has been written
+def flushAsync():
+    if vqueue is not None and vthread.is_alive():
+        vqueue.join()
+
+def fmtTime(ts):
+    return datetime.datetime.fromtimestamp(ts).strftime('%Y-%m-%d %H:%M:%S')
+
+# take up to vbatch messages at a time and write each stream's share in one go
+def asyncWriter(q):
+    while True:
+        items = getBatch(q)
+        try:
+            writeBatch(items)
+        finally:
+            for item in items:
+                q.task_done()
+        if None in items:
+            return
+
+# first item blocking, then whatever else is already queued (works for both queue kinds)
+def getBatch(q):
+    items = [q.get()]
+    while len(items) < vbatch:
+        try:
+            items.append(q.get_nowait())
+        except queue.Empty:
+            break
+    return items
+
+# a failed write (closed stream, broken pipe, disk full, ...) is counted in
+# vwriteerrors and the writer carries on, so nothing waiting on it can hang
+def writeBatch(items):
+    global vwriteerrors
+    out = {}
+    order = []
+    for item in items:
+        if item is None:
+            continue
+        ts,filename,func,message,fh,labels,tee,teelabels = item
+        dt = fmtTime(ts)
+        mod = os.path.basename(filename)
+        for f,l in ((fh,labels),(tee,teelabels)):
+            if f is not None:
+                if f not in out:
+                    out[f] = []
+                    order.append(f)
+                out[f].append("%s%s\n" % (showLabel(l,dt,mod,func),message))
+    for f in order:
+        try:
+            f.write(''.join(out[f]))
+            f.flush()
+        except Exception:
+            vwriteerrors += 1
+
+# Multiprocess channel: after startChannel in the parent, messages from it and
+# its forked workers are sent over a multiprocessing queue and written by one
+# thread in the parent to its vfh, each tagged with the worker name (the process
+# name unless setWorker is called). A worker's tee stream is still written by
+# the worker.
+def startChannel():
+    global vchannel
+    global vchannelpid
+    global vchthread
+    stopChannel()
+    vchannel = mp.Queue()
+    vchannelpid = os.getpid()
+    vchthread = threading.Thread(target=channelWriter,args=(vchannel,),name="verbose-channel")
+    vchthread.daemon = True
+    vchthread.start()
+
+# only the parent can stop it; call once the workers have been joined
+def stopChannel():
+    global vchannel
+    global vchannelpid
+    global vchthread
+    if vchannel is not None and os.getpid() == vchannelpid:
+        vchannel.put(None)
+        vchthread.join()
+        vchannel.close()
+        vchannel = None
+        vchannelpid = None
+        vchthread = None
+
+atexit.register(stopChannel)
+
+def setWorker(name):
+    global vworker
+    vworker = name
+
+def channelWriter(q):
+    while True:
+        records = getBatch(q)
+        writeBatch([None if r is None else r[:3] + ("%s: %s" % (r[5],r[3]),vfh,r[4],None,None) for r in records])
+        if None in records:
+            return
+
+# Timers and counters for this process. Each timer keeps a count, a total and a
+# random sample of at most vtimersamples durations for the percentiles.
+#   with verbose.Timer("forward"): ...        # time a block
+#   @verbose.timed("make_x_y")                # time every call of a function
+#   verbose.counter("batches")                # count something
+class Timer(object):
+    __slots__ = ("name","t0")
+    def __init__(self,name):
+        self.name = name
+    def __enter__(self):
+        self.t0 = vclock()
+        return self
+    def __exit__(self,*exc):
+        timerAdd(self.name,vclock()-self.t0)
+        return False
+
+def timed(name):
+    def decorator(func):
+        def wrapper(*args,**kwargs):
+            with Timer(name):
+                return func(*args,**kwargs)
+        wrapper.__name__ = func.__name__
+        wrapper.__doc__ = func.__doc__
+        return wrapper
+    return decorator
+
+def counter(name,n=1):
+    vcounters[name] = vcounters.get(name,0) + n
+
+def timerAdd(name,secs):
+    t = vtimers.get(name)
+    if t is None:
+        t = vtimers[name] = [0,0.0,[]]
+    t[0] += 1
+    t[1] += secs
+    if len(t[2]) < vtimersamples:
+        t[2].append(secs)
+    else:
+        i = int(random.random()*t[0])
+        if i < vtimersamples:
+            t[2][i] = secs
+
+def timerReset():
+    global vtimerlast
+    vtimers.clear()
+    vcounters.clear()
+    vtimerlast = time.time()
+
+# picklable copy of this process's timers and counters, eg. to return from a worker
+def timerState():
+    return {"timers":dict((k,[t[0],t[1],list(t[2])]) for k,t in vtimers.items()), "counters":dict(vcounters)}
+
+# merge states from several processes into one
+def timerMerge(states):
+    timers = {}
+    counters = {}
+    for state in states:
+        for k,(n,total,samples) in state["timers"].items():
+            t = timers.setdefault(k,[0,0.0,[]])
+            t[0] += n
+            t[1] += total
+            t[2].extend(samples)
+        for k,n in state["counters"].items():
+            counters[k] = counters.get(k,0) + n
+    for t in timers.values():
+        if len(t[2]) > vtimersamples:
+            t[2] = random.sample(t[2],vtimersamples)
+    return {"timers":timers, "counters":counters}
+
+def percentile(samples,p):
+    return samples[min(len(samples)-1,int(p*len(samples)))]
+
+# write count, total, mean, p50 and p99 of each timer (and each counter) through verbose
+def timerSummary(levels,state=None,title="timings"):
+    if not isLevel(levels):
+        return
+    state = state or timerState()
+    lines = []
+    for k in sorted(state["timers"]):
+        n,total,samples = state["timers"][k]
+        samples = sorted(samples)
+        lines.append("%s: %-20s n=%d total=%.3fs mean=%.3fms p50=%.3fms p99=%.3fms" % (title,k,n,total,total*1e3/n,percentile(samples,0.5)*1e3,percentile(samples,0.99)*1e3))
+    for k in sorted(state["counters"]):
+        lines.append("%s: %-20s %d" % (title,k,state["counters"][k]))
+    for line in lines:
+        verbose(levels,line,labels=["dt"])
+
+# timerSummary at most every seconds, for calling from a loop
+def timerDump(levels,seconds,title="timings"):
+    global vtimerlast
+    if time.time() >= vtimerlast+seconds:
+        vtimerlast = time.time()
+        timerSummary(levels,title=title)
+
 def showLabel(labels,dt,mod,func):
     label = ""
     if "dt" in labels:
@@ -122,10 +380,19 @@ def showLabel(labels,dt,mod,func):
         label = label + "%s: "%(func)
     return label
 
+# requested levels are parsed once per distinct value and compared with the
+# set built by setLevels, so a disabled call costs a dict lookup at most
 def isLevel(levels):
-    ilevel,slevels = splitLevels(levels)
-    ivlevel,svlevels = splitLevels(vlevels)
-    if (ivlevel is not None and ilevel is not None and ivlevel >= ilevel) or set(slevels) & set(svlevels):
+    if type(levels) is int:
+        return vmaxlevel is not None and vmaxlevel >= levels
+    key = tuple(levels) if type(levels) is list else levels
+    try:
+        ilevel,slevels = vparsed[key]
+    except KeyError:
+        ilevel,slevels = splitLevels(levels)
+        slevels = frozenset(slevels)
+        vparsed[key] = ilevel,slevels
+    if (vmaxlevel is not None and ilevel is not None and vmaxlevel >= ilevel) or not slevels.isdisjoint(vstrlevels):
         return True
     else:
         return False
@@ -134,14 +401,33 @@ def isLevel(levels):
 #       ilevel,slevels = splitLevels(levels)
 #       showlevels = "%s" % (','.join([str(ilevel)] + slevels))
 def verbose(levels,message,tee=None,labels=["dt","mod","func"],teelabels=["dt","mod","func"]):
+    global vdropped
+    if not isLevel(levels):
+        return
     ts = time.time()
-    dt = datetime.datetime.fromtimestamp(ts).strftime('%Y-%m-%d %H:%M:%S')
-    mod = os.path.basename(sys._getframe(1).f_code.co_filename)
-    func = sys._getframe(1).f_code.co_name
-    if isLevel(levels):
-        print ("%s%s" % (showLabel(labels,dt,mod,func),message), file=vfh)
+    code = sys._getframe(1).f_code
+    if vchannel is not None:
+        worker = vworker if vworker is not None else mp.current_process().name
+        vchannel.put((ts,code.co_filename,code.co_name,message,labels,worker))
         if tee is not None:
-            print ("%s%s" % (showLabel(teelabels,dt,mod,func),message), file=tee)
+            print ("%s%s" % (showLabel(teelabels,fmtTime(ts),os.path.basename(code.co_filename),code.co_name),message), file=tee)
+        return
+    if vqueue is not None:
+        item = (ts,code.co_filename,code.co_name,message,vfh,labels,tee,teelabels)
+        if vpolicy == "drop":
+            try:
+                vqueue.put_nowait(item)
+            except queue.Full:
+                vdropped += 1
+        else:
+            vqueue.put(item)
+        return
+    dt = fmtTime(ts)
+    mod = os.path.basename(code.co_filename)
+    func = code.co_name
+    print ("%s%s" % (showLabel(labels,dt,mod,func),message), file=vfh)
+    if tee is not None:
+        print ("%s%s" % (showLabel(teelabels,dt,mod,func),message), file=tee)
 
 
 """
@@ -164,7 +450,25 @@ verbose.verbose("99","message")                     # output if verbose level >=
 verbose.verbose(99,"message")                       # output if verbose level >= 99
 verbose.isLevel("99,blah")                          # True if verbose level >= 99 or verbose str is "blah"
 verbose.setStream(sys.stderr)                       # will call closeFile() if necessary before redirecting
-verbose.closeFile()
+verbose.startAsync(10000,"drop")                    # write from a background thread, dropping when 10000 are queued
+verbose.flushAsync()                                # wait for queued messages to be written
+verbose.stopAsync()                                 # flush, stop the thread and write in-line again
+verbose.closeFile()                                 # flushes queued messages first
+verbose.startChannel()                              # in the parent: forked workers send messages to it to write
+verbose.setWorker("job3")                           # in a worker: tag its messages (default: process name)
+verbose.stopChannel()                               # in the parent, after joining the workers
+with verbose.Timer("read"): ...                      # time a block (also @verbose.timed("read") for a function)
+verbose.counter("lines",n)                          # add n to a counter
+verbose.timerSummary([2,"timing"])                  # count/total/mean/p50/p99 of each timer through verbose
+verbose.timerDump([2,"timing"],60)                  # the same, at most once a minute
+state = verbose.timerState()                        # in a worker: picklable timers to send back to the parent
+verbose.timerSummary(1,verbose.timerMerge(states))  # in the parent: merged timers of all the workers
+
+Levels are precompiled by setLevels, so set them with setLevels rather than by assigning
+to vlevels. Disabled calls return before any timestamp or frame work is done.
+
+Benchmark (cost per disabled call, against an empty loop):
+python bin/verbose.py --bench [n]
 
 Testing (doctest):
 python -m doctest verbose.py -v
@@ -185,7 +489,20 @@ Eg output for "3 show":
 
 """
 
+# time n disabled calls of each kind of level and report the cost per call over an empty loop
+def benchmark(n=1000000):
+    import timeit
+    setLevels(0)
+    base = timeit.timeit("pass", number=n)
+    for stmt in ['verbose(5,"m")', 'verbose("5,blah","m")', 'verbose([5,"blah"],"m")', 'isLevel([5,"blah"])']:
+        t = timeit.timeit(stmt, number=n, globals=globals())
+        print ("%-28s %8.1f ns/call" % (stmt, (t-base)*1e9/n))
+
 if __name__ == "__main__":
+    if len(sys.argv) >= 2 and sys.argv[1] == "--bench":
+        benchmark(int(sys.argv[2]) if len(sys.argv) >= 3 else 1000000)
+        sys.exit(0)
+
     def myTestFunc():
         tests = [[1,"show"],
                  [2,"func"],